@@ -1,34 +1,245 @@
 # asr_service/app.py
 
-import os
-import uuid
-from fastapi import FastAPI, UploadFile, File
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from fastapi import FastAPI, UploadFile, File, HTTPException, WebSocket
 from fastapi.responses import JSONResponse
-from asr_loader import model
-import whisper
+from asr_loader import load_model, MODEL_NAME
+from audio_decode import decode_audio
+from batcher import ASRBatcher
+from longform import LongFormTranscriber, START_METHOD as LONGFORM_START_METHOD
+from streaming import StreamingSession
+from transcript_cache import TranscriptCache
+from vad import trim_silence
+import vad
+import numpy as np
+import os
+import threading
 import time
 
 app = FastAPI(title="Whisper ASR Service")
 
+# 模型在后台线程中加载，服务启动后立即响应健康检查；加载完成前推理接口返回 503
+model = None
+longform = None
+batcher = None
+
+STARTED_AT = time.time()
+readiness = {"status": "starting", "error": None, "load_sec": None, "warmup_sec": None,
+             "longform": "pending"}
+
+# 报告 ready 前的预热推理次数（0 表示不预热）
+WARMUP_RUNS = int(os.environ.get("ASR_WARMUP_RUNS", 1))
+
+transcript_cache = TranscriptCache()
+
+# 解码（可能调用 ffmpeg 子进程）、重采样、哈希与 VAD 都是阻塞的 CPU/IO 操作，放到线程池中执行，
+# 避免并发上传时阻塞事件循环
+PREPROCESS_WORKERS = int(os.environ.get("ASR_PREPROCESS_WORKERS", min(4, os.cpu_count() or 1)))
+preprocess_executor = ThreadPoolExecutor(max_workers=PREPROCESS_WORKERS, thread_name_prefix="asr-preprocess")
+
+# 参与缓存键的解码/预处理参数，任何一项变化都不会命中旧结果
+CACHE_OPTIONS = {
+    "fp16": False,
+    "vad_margin_db": vad.MARGIN_DB,
+    "vad_abs_threshold_db": vad.ABS_THRESHOLD_DB,
+    "vad_max_pause_ms": vad.MAX_PAUSE_MS,
+}
+
+def load_models():
+    """
+    Load Whisper, start the batcher and warm up, then start the long-form pool.
+    """
+    global model, batcher
+    try:
+        readiness["status"] = "loading"
+        t_start = time.time()
+        model = load_model()
+        if LONGFORM_START_METHOD == "fork":
+            # fork 须在批处理线程启动、以及任何推理（含预热）之前
+            start_longform()
+        # 所有推理都经由批处理线程，避免阻塞事件循环
+        batcher = ASRBatcher(model)
+        readiness["load_sec"] = round(time.time() - t_start, 3)
+
+        readiness["status"] = "warming_up"
+        t_start = time.time()
+        warm_up(WARMUP_RUNS)
+        readiness["warmup_sec"] = round(time.time() - t_start, 3)
+
+        readiness["status"] = "ready"
+        print(f"ASR ready (load {readiness['load_sec']} s, warm-up {readiness['warmup_sec']} s).")
+    except Exception as e:
+        readiness.update(status="failed", error=repr(e))
+        print(f"ASR model loading failed: {e!r}")
+        return
+
+    if readiness["longform"] == "pending":
+        start_longform()
+
+
+def start_longform():
+    """
+    Start the long-form worker pool. A failure only disables /asr/long.
+    """
+    global longform
+    readiness["longform"] = "starting"
+    try:
+        longform = LongFormTranscriber(model, MODEL_NAME)
+        readiness["longform"] = "ready"
+    except Exception as e:
+        readiness["longform"] = f"failed: {e!r}"
+        print(f"Long-form pool unavailable, /asr/long disabled: {e!r}")
+
+
+def warm_up(runs):
+    """
+    Push one second of low-level noise through the batcher so the first real
+    request does not pay for kernel and mel-filter setup.
+    """
+    audio = (np.random.default_rng(0).standard_normal(16000) * 1e-3).astype(np.float32)
+    for _ in range(runs):
+        batcher.submit(audio).result()
+
+
+async def _offload(func, *args):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(preprocess_executor, func, *args)
+
+
+async def _decode_upload(file):
+    try:
+        return await _offload(decode_audio, await file.read(), file.content_type)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+def _lookup(audio):
+    cache_key = TranscriptCache.make_key(audio, MODEL_NAME, CACHE_OPTIONS)
+    return cache_key, transcript_cache.get(cache_key)
+
+
+def _require_ready():
+    if readiness["status"] != "ready":
+        raise HTTPException(status_code=503, detail=f"ASR model not ready ({readiness['status']})",
+                            headers={"Retry-After": "5"})
+
+
+@app.on_event("startup")
+def start_loading():
+    threading.Thread(target=load_models, name="asr-loader", daemon=True).start()
+
+
+@app.get("/health/live")
+async def health_live():
+    # 后台加载失败时进程已无法恢复，报告不存活以便被重启
+    alive = readiness["status"] != "failed"
+    body = {"status": "alive" if alive else "failed", "uptime_sec": round(time.time() - STARTED_AT, 1)}
+    return JSONResponse(body, status_code=200 if alive else 500)
+
+
+@app.get("/health/ready")
+async def health_ready():
+    body = {**readiness, "model": MODEL_NAME, "uptime_sec": round(time.time() - STARTED_AT, 1)}
+    return JSONResponse(body, status_code=200 if readiness["status"] == "ready" else 503)
+
+
 @app.post("/asr")
 async def asr_endpoint(file: UploadFile = File(...)):
+    _require_ready()
 
     t_start = time.time()
-    # 生成临时文件名
-    temp_filename = f"temp_{uuid.uuid4().hex}.wav"
 
-    # 保存上传的音频
-    with open(temp_filename, "wb") as f:
-        f.write(await file.read())
+    # 直接在内存中解码为 16 kHz float32（WAV/PCM 快速路径，其余格式走 ffmpeg 管道）
+    audio = await _decode_upload(file)
+
+    cache_key, cached = await _offload(_lookup, audio)
+    if cached is not None:
+        print(f"Cache hit in {time.time() - t_start} seconds.")
+        return JSONResponse({**cached, "cached": True})
+
+    # VAD：去掉首尾静音并压缩长停顿；完全没有语音时直接返回，不跑模型
+    audio, vad_stats = await _offload(trim_silence, audio)
+    print(f"VAD removed {vad_stats['removed_sec']} of {vad_stats['input_sec']} seconds.")
 
-    # Whisper 自动检测格式
-    result = model.transcribe(temp_filename, fp16=False)
+    if not vad_stats["speech"]:
+        response = {"text": "", "vad": vad_stats}
+    else:
+        result = await batcher.transcribe(audio)
+        response = {"text": result["text"], "vad": vad_stats}
 
-    # 删除临时文件
-    os.remove(temp_filename)
+    # 达到保存间隔时 put 会写磁盘
+    await _offload(transcript_cache.put, cache_key, response)
 
     t_end = time.time()
 
     print(f"Finished in {t_end - t_start} seconds.")
 
-    return JSONResponse({"text": result["text"]})
\ No newline at end of file
+    return JSONResponse({**response, "cached": False})
+
+
+@app.post("/asr/long")
+async def asr_long_endpoint(file: UploadFile = File(...)):
+    """
+    Long-form mode: split at pauses, transcribe chunks in parallel, return ordered segments.
+    """
+    _require_ready()
+    if longform is None:
+        # 进程池启动失败时不会恢复，不给 Retry-After
+        starting = readiness["longform"] in ("pending", "starting")
+        raise HTTPException(status_code=503, detail=f"Long-form pool not available ({readiness['longform']})",
+                            headers={"Retry-After": "5"} if starting else None)
+
+    t_start = time.time()
+
+    audio = await _decode_upload(file)
+
+    result = await longform.transcribe(audio)
+
+    t_end = time.time()
+
+    print(f"Long-form: {len(audio) / 16000:.1f} s of audio in {result['chunks']} chunk(s), "
+          f"finished in {t_end - t_start} seconds.")
+
+    return JSONResponse(result)
+
+
+@app.get("/asr/cache/stats")
+async def cache_stats():
+    return transcript_cache.stats()
+
+
+@app.on_event("shutdown")
+def shutdown():
+    transcript_cache.save()
+    if longform is not None:
+        longform.shutdown()
+    preprocess_executor.shutdown(wait=False)
+
+
+@app.websocket("/asr/stream")
+async def asr_stream(websocket: WebSocket, sample_rate: int = 16000, language: str = None):
+    """
+    Streaming ASR.
+    Client -> server: binary frames of 16-bit little-endian mono PCM, text "end" when the utterance is over.
+    Server -> client: {"type": "partial", "committed", "tentative"} while speaking, {"type": "final", "text"} at the end.
+    """
+    await websocket.accept()
+    if readiness["status"] != "ready":
+        # 1013 = Try Again Later
+        await websocket.close(code=1013, reason=f"ASR model not ready ({readiness['status']})")
+        return
+    session = StreamingSession(batcher, sample_rate=sample_rate, language=language)
+
+    while True:
+        message = await websocket.receive()
+        if message["type"] == "websocket.disconnect":
+            break
+
+        if message.get("bytes"):
+            if session.add_pcm(message["bytes"]):
+                await websocket.send_json(await session.partial())
+        elif (message.get("text") or "").strip().lower() == "end":
+            t_start = time.time()
+            await websocket.send_json(await session.finish())
+            print(f"Stream finalized in {time.time() - t_start} seconds after end of speech.")
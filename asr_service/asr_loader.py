@@ -1,13 +1,20 @@
 # asr_service/asr_loader.py
 
+import time
+
 import torch
 import whisper
 
-print("Loading Whisper ASR model...")
-
 # 你可选 tiny / base / small / medium / large-v3
 MODEL_NAME = "small"
 
-model = whisper.load_model(MODEL_NAME)
 
-print(f"Whisper ASR model loaded, model = {MODEL_NAME}")
\ No newline at end of file
+def load_model(name=MODEL_NAME):
+    """
+    Load Whisper; called from the service's background loader thread.
+    """
+    print("Loading Whisper ASR model...")
+    t_start = time.time()
+    model = whisper.load_model(name)
+    print(f"Whisper ASR model loaded, model = {name} ({time.time() - t_start:.1f} s)")
+    return model
@@ -0,0 +1,217 @@
+# asr_service/audio_decode.py
+
+"""
+In-memory audio decoding for the ASR service.
+
+Uploaded bytes are turned directly into the 16 kHz mono float32 array that
+Whisper expects, without touching the disk:
+
+- WAV (PCM 8/16/24/32-bit) is parsed with the `wave` module and resampled
+  with a windowed-sinc polyphase filter (`Resampler`)
+- raw PCM (`audio/L16` / `audio/pcm`, 16-bit little-endian) is wrapped as-is
+- everything else is piped through ffmpeg (stdin -> stdout), like whisper.load_audio
+"""
+
+import io
+import math
+import subprocess
+import wave
+
+import numpy as np
+import torch
+import torch.nn.functional as F
+
+SAMPLE_RATE = 16000
+# 整段重采样时每次送入的输入长度（秒），限制卷积的中间内存
+RESAMPLE_CHUNK_SEC = 30
+
+PCM_CONTENT_TYPES = ("audio/l16", "audio/pcm", "audio/x-raw")
+
+
+def decode_audio(data: bytes, content_type: str = None) -> np.ndarray:
+    """
+    Decode an uploaded audio payload into a 16 kHz mono float32 array.
+    :param data: Raw bytes of the upload
+    :param content_type: Optional MIME type of the upload (used to detect raw PCM)
+    """
+    if not data:
+        raise ValueError("Empty audio payload")
+
+    if data[:4] == b"RIFF" and data[8:12] == b"WAVE":
+        try:
+            return decode_wav(data)
+        except (wave.Error, EOFError, ValueError):
+            # float / compressed WAV variants are left to ffmpeg
+            pass
+
+    mime, params = _parse_content_type(content_type)
+    if mime in PCM_CONTENT_TYPES:
+        rate = int(params.get("rate", SAMPLE_RATE))
+        channels = int(params.get("channels", 1))
+        return decode_pcm(data, sample_rate=rate, channels=channels)
+
+    return decode_ffmpeg(data)
+
+
+def decode_wav(data: bytes) -> np.ndarray:
+    """
+    Fast path: decode integer PCM WAV bytes with the standard library.
+    """
+    with wave.open(io.BytesIO(data), "rb") as wf:
+        channels = wf.getnchannels()
+        width = wf.getsampwidth()
+        rate = wf.getframerate()
+        frames = wf.readframes(wf.getnframes())
+
+    audio = _pcm_to_float(frames, width)
+    return _to_mono_16k(audio, rate, channels)
+
+
+def decode_pcm(data: bytes, sample_rate: int = SAMPLE_RATE, channels: int = 1) -> np.ndarray:
+    """
+    Fast path: headerless 16-bit little-endian PCM.
+    """
+    usable = len(data) - len(data) % (2 * channels)
+    audio = _pcm_to_float(data[:usable], 2)
+    return _to_mono_16k(audio, sample_rate, channels)
+
+
+def decode_ffmpeg(data: bytes, sr: int = SAMPLE_RATE) -> np.ndarray:
+    """
+    Fallback: let ffmpeg decode any container/codec over pipes (no temp files).
+    """
+    cmd = [
+        "ffmpeg",
+        "-nostdin",
+        "-threads", "0",
+        "-i", "pipe:0",
+        "-f", "s16le",
+        "-ac", "1",
+        "-acodec", "pcm_s16le",
+        "-ar", str(sr),
+        "pipe:1",
+    ]
+    try:
+        out = subprocess.run(cmd, input=data, capture_output=True, check=True).stdout
+    except FileNotFoundError as e:
+        raise RuntimeError("ffmpeg is required to decode non-WAV audio") from e
+    except subprocess.CalledProcessError as e:
+        raise ValueError(f"Failed to decode audio: {e.stderr.decode(errors='ignore')}") from e
+
+    return np.frombuffer(out, np.int16).flatten().astype(np.float32) / 32768.0
+
+
+def resample(audio: np.ndarray, orig_sr: int, target_sr: int = SAMPLE_RATE) -> np.ndarray:
+    """
+    Resample a complete 1-D float signal (fed to a `Resampler` in chunks).
+    """
+    if orig_sr == target_sr or len(audio) == 0:
+        return audio.astype(np.float32, copy=False)
+
+    resampler = Resampler(orig_sr, target_sr)
+    chunk = RESAMPLE_CHUNK_SEC * orig_sr
+    parts = [resampler.process(audio[i:i + chunk]) for i in range(0, len(audio), chunk)]
+    parts.append(resampler.flush())
+    return np.concatenate(parts)
+
+
+class Resampler:
+    """
+    Windowed-sinc polyphase resampler (the same Hann-windowed kernel as
+    torchaudio.functional.resample), usable incrementally: `process` returns
+    every output sample whose input window is complete, `flush` the rest once
+    the input has ended. Feeding a signal in pieces gives exactly the same
+    output as resampling it in one go.
+    """
+
+    def __init__(self, orig_sr: int, target_sr: int = SAMPLE_RATE, lowpass_filter_width=6, rolloff=0.99):
+        gcd = math.gcd(orig_sr, target_sr)
+        self.orig = orig_sr // gcd
+        self.new = target_sr // gcd
+        self.kernel, self.width = _sinc_kernel(self.orig, self.new, lowpass_filter_width, rolloff)
+        # 左侧补零，与整段重采样的边界处理一致
+        self._buf = np.zeros(self.width, np.float32)
+        self._n_in = 0
+        self._n_out = 0
+
+    def process(self, audio: np.ndarray) -> np.ndarray:
+        if self.orig == self.new:
+            return audio.astype(np.float32, copy=False)
+        self._n_in += len(audio)
+        self._buf = np.concatenate([self._buf, audio.astype(np.float32, copy=False)])
+        return self._run()
+
+    def flush(self) -> np.ndarray:
+        if self.orig == self.new:
+            return np.zeros(0, np.float32)
+        self._buf = np.concatenate([self._buf, np.zeros(self.width + self.orig, np.float32)])
+        return self._run(limit=math.ceil(self.new * self._n_in / self.orig))
+
+    def _run(self, limit=None):
+        kernel_len = self.kernel.shape[-1]
+        if len(self._buf) < kernel_len:
+            return np.zeros(0, np.float32)
+        # 每个 block 消耗 orig 个输入样本，产生 new 个输出样本
+        n_blocks = (len(self._buf) - kernel_len) // self.orig + 1
+        used = (n_blocks - 1) * self.orig + kernel_len
+        x = torch.from_numpy(self._buf[:used])[None, None]
+        with torch.no_grad():
+            y = F.conv1d(x, self.kernel, stride=self.orig)
+        out = y[0].t().reshape(-1).numpy()
+        self._buf = self._buf[n_blocks * self.orig:]
+        if limit is not None:
+            out = out[:max(0, limit - self._n_out)]
+        self._n_out += len(out)
+        return out
+
+
+def _sinc_kernel(orig, new, lowpass_filter_width, rolloff):
+    """
+    Polyphase filter bank of shape (new, 1, 2 * width + orig), one row per output phase.
+    """
+    base_freq = min(orig, new) * rolloff
+    width = math.ceil(lowpass_filter_width * orig / base_freq)
+    idx = np.arange(-width, width + orig, dtype=np.float64)[None, :] / orig
+    t = (np.arange(0, -new, -1, dtype=np.float64)[:, None] / new + idx) * base_freq
+    t = np.clip(t, -lowpass_filter_width, lowpass_filter_width)
+    window = np.cos(t * math.pi / lowpass_filter_width / 2) ** 2
+    t *= math.pi
+    kernels = np.sinc(t / math.pi) * window * (base_freq / orig)
+    return torch.from_numpy(kernels.astype(np.float32))[:, None, :], width
+
+
+def _pcm_to_float(frames: bytes, width: int) -> np.ndarray:
+    if width == 1:
+        # 8-bit WAV is unsigned
+        return (np.frombuffer(frames, np.uint8).astype(np.float32) - 128.0) / 128.0
+    if width == 2:
+        return np.frombuffer(frames, "<i2").astype(np.float32) / 32768.0
+    if width == 3:
+        raw = np.frombuffer(frames, np.uint8).reshape(-1, 3)
+        ints = (raw[:, 0].astype(np.int32)
+                | (raw[:, 1].astype(np.int32) << 8)
+                | (raw[:, 2].astype(np.int32) << 16))
+        ints = np.where(ints & 0x800000, ints - 0x1000000, ints)
+        return ints.astype(np.float32) / 8388608.0
+    if width == 4:
+        return np.frombuffer(frames, "<i4").astype(np.float32) / 2147483648.0
+    raise ValueError(f"Unsupported sample width: {width}")
+
+
+def _to_mono_16k(audio: np.ndarray, rate: int, channels: int) -> np.ndarray:
+    if channels > 1:
+        audio = audio[: len(audio) - len(audio) % channels]
+        audio = audio.reshape(-1, channels).mean(axis=1)
+    return resample(audio, rate, SAMPLE_RATE)
+
+
+def _parse_content_type(content_type):
+    if not content_type:
+        return "", {}
+    parts = [p.strip() for p in content_type.split(";")]
+    params = {}
+    for p in parts[1:]:
+        if "=" in p:
+            k, v = p.split("=", 1)
+            params[k.strip().lower()] = v.strip()
+    return parts[0].lower(), params
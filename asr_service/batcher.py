@@ -0,0 +1,139 @@
+# asr_service/batcher.py
+
+"""
+Dynamic micro-batching for Whisper.
+
+Requests are put on a queue and picked up by a single worker thread, which
+waits up to `max_wait_ms` for more requests (at most `max_batch_size`), pads
+every clip to Whisper's 30 s window and runs one batched `whisper.decode`
+over the shared model. Each caller gets its own result back through a Future,
+so the FastAPI event loop never blocks on inference.
+
+Clips longer than 30 s (and batched results that look like decoding failures)
+fall back to the regular `model.transcribe` on the same worker thread.
+"""
+
+import asyncio
+import json
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import torch
+import whisper
+
+MAX_BATCH_SIZE = int(os.environ.get("ASR_MAX_BATCH_SIZE", 8))
+MAX_WAIT_MS = float(os.environ.get("ASR_MAX_WAIT_MS", 30))
+
+# 与 whisper.transcribe 默认的温度回退阈值一致
+COMPRESSION_RATIO_THRESHOLD = 2.4
+LOGPROB_THRESHOLD = -1.0
+
+
+class _Request:
+    __slots__ = ("audio", "options", "fallback", "future")
+
+    def __init__(self, audio, options, fallback, future):
+        self.audio = audio
+        self.options = options
+        self.fallback = fallback
+        self.future = future
+
+
+class ASRBatcher:
+    def __init__(self, model, max_batch_size=MAX_BATCH_SIZE, max_wait_ms=MAX_WAIT_MS):
+        self.model = model
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="asr-batcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, audio, fallback=True, **options) -> Future:
+        """
+        Queue a 16 kHz float32 clip for transcription.
+        :param fallback: Re-run poor greedy results with the full transcribe (slower)
+        :param options: whisper.DecodingOptions fields (language, task, prompt, prefix, ...)
+        """
+        future = Future()
+        self._queue.put(_Request(audio, options, fallback, future))
+        return future
+
+    async def transcribe(self, audio, fallback=True, **options):
+        return await asyncio.wrap_future(self.submit(audio, fallback=fallback, **options))
+
+    def qsize(self):
+        return self._queue.qsize()
+
+    # ---------------- worker ----------------
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self._process(batch)
+
+    def _process(self, batch):
+        groups = {}
+        for req in batch:
+            if not req.future.set_running_or_notify_cancel():
+                continue
+            if len(req.audio) > whisper.audio.N_SAMPLES:
+                self._run_single(req)
+            else:
+                key = json.dumps(req.options, sort_keys=True, default=str)
+                groups.setdefault(key, []).append(req)
+
+        for reqs in groups.values():
+            try:
+                results = self._decode_batch(reqs)
+            except Exception as e:
+                for req in reqs:
+                    req.future.set_exception(e)
+                continue
+
+            for req, res in zip(reqs, results):
+                if req.fallback and (res.compression_ratio > COMPRESSION_RATIO_THRESHOLD
+                                     or res.avg_logprob < LOGPROB_THRESHOLD):
+                    # 贪心解码质量不佳时，回退到带温度回退的完整 transcribe
+                    self._run_single(req)
+                else:
+                    req.future.set_result({"text": res.text, "language": res.language})
+
+    def _decode_batch(self, reqs):
+        t_start = time.time()
+        mel = torch.stack([
+            whisper.log_mel_spectrogram(
+                whisper.pad_or_trim(torch.from_numpy(req.audio)),
+                n_mels=self.model.dims.n_mels,
+            )
+            for req in reqs
+        ]).to(self.model.device)
+
+        options = whisper.DecodingOptions(fp16=False, **reqs[0].options)
+        results = whisper.decode(self.model, mel, options)
+
+        print(f"Batched decode of {len(reqs)} clip(s) in {time.time() - t_start:.3f} seconds.")
+        return results
+
+    def _run_single(self, req):
+        options = dict(req.options)
+        if "prompt" in options:
+            options["initial_prompt"] = options.pop("prompt")
+        try:
+            result = self.model.transcribe(req.audio, fp16=False, **options)
+        except Exception as e:
+            req.future.set_exception(e)
+            return
+        req.future.set_result({"text": result["text"], "language": result["language"]})
@@ -0,0 +1,147 @@
+# asr_service/longform.py
+
+"""
+Parallel long-form transcription.
+
+Long recordings are cut at low-energy points (so chunks end in pauses rather
+than mid-word) into pieces no longer than Whisper's 30 s window. Chunks are
+transcribed independently on a pool of worker processes. Segments are
+shifted by their chunk offset and stitched back in order.
+
+Workers are started with `spawn` by default (the only method on Windows):
+each one loads its own copy of the model in the pool initializer, so the
+default worker count is kept small. On Unix, ASR_LONGFORM_START_METHOD=fork
+shares the parent's weights copy-on-write instead; the service is already
+multi-threaded by then (uvicorn, the loader thread), so that is an opt-in
+trade of fork safety for memory. Either way the workers are started eagerly
+in __init__, so the first long request does not pay for it.
+"""
+
+import asyncio
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from audio_decode import SAMPLE_RATE
+from vad import FRAME_MS, frame_energy_db
+
+START_METHOD = os.environ.get("ASR_LONGFORM_START_METHOD", "spawn")
+# spawn 时每个子进程各自加载一份模型，默认少开几个
+_DEFAULT_WORKERS = max(1, (os.cpu_count() or 2) // 2)
+WORKERS = int(os.environ.get("ASR_LONGFORM_WORKERS",
+                             _DEFAULT_WORKERS if START_METHOD == "fork" else min(2, _DEFAULT_WORKERS)))
+MAX_CHUNK_SEC = 28.0
+# 在每段末尾的这个范围内寻找能量最低的帧作为切点
+SEARCH_SEC = 8.0
+
+# fork：父进程在 fork 前设置，子进程以写时复制方式共享；spawn：子进程在 initializer 中加载
+_model = None
+
+
+def split_at_silence(audio: np.ndarray, sr: int = SAMPLE_RATE,
+                     max_chunk_sec: float = MAX_CHUNK_SEC, search_sec: float = SEARCH_SEC):
+    """
+    Split audio into chunks of at most max_chunk_sec, cutting at the quietest frame.
+    :return: list of (start_sample, end_sample)
+    """
+    frame_len = sr * FRAME_MS // 1000
+    energy = frame_energy_db(audio, frame_len)
+    max_len = int(max_chunk_sec * sr)
+    search_len = int(search_sec * sr)
+
+    bounds = []
+    start = 0
+    while len(audio) - start > max_len:
+        lo = (start + max_len - search_len) // frame_len
+        hi = (start + max_len) // frame_len
+        cut = (lo + int(np.argmin(energy[lo:hi]))) * frame_len
+        if cut <= start:
+            cut = start + max_len
+        bounds.append((start, cut))
+        start = cut
+    bounds.append((start, len(audio)))
+    return bounds
+
+
+def _init_worker(num_threads, model_name=None):
+    import torch
+    torch.set_num_threads(num_threads)
+    if model_name is not None:
+        global _model
+        from asr_loader import load_model
+        _model = load_model(model_name)
+
+
+def _ping():
+    return os.getpid()
+
+
+def _transcribe_chunk(audio, offset_sec, options):
+    result = _model.transcribe(audio, fp16=False, **options)
+    segments = [
+        {
+            "start": round(seg["start"] + offset_sec, 3),
+            "end": round(seg["end"] + offset_sec, 3),
+            "text": seg["text"],
+        }
+        for seg in result["segments"]
+    ]
+    return {"text": result["text"].strip(), "language": result["language"], "segments": segments}
+
+
+class LongFormTranscriber:
+    def __init__(self, model, model_name, workers=WORKERS, start_method=START_METHOD):
+        """
+        Raises ValueError when `start_method` is not available on this platform.
+        """
+        global _model
+        mp_context = multiprocessing.get_context(start_method)
+        if start_method == "fork":
+            _model = model
+            worker_model_name = None
+        else:
+            worker_model_name = model_name
+
+        self.workers = workers
+        self.start_method = start_method
+        threads = max(1, (os.cpu_count() or 1) // workers)
+        self._pool = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=mp_context,
+            initializer=_init_worker,
+            initargs=(threads, worker_model_name),
+        )
+        # 立即启动所有子进程（spawn 时等待各自加载完模型）
+        try:
+            pids = {f.result() for f in [self._pool.submit(_ping) for _ in range(workers)]}
+        except Exception:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            raise
+        print(f"Long-form pool ready: {len(pids)} worker process(es) ({start_method}), "
+              f"{threads} thread(s) each")
+
+    async def transcribe(self, audio: np.ndarray, **options):
+        bounds = split_at_silence(audio)
+        futures = [
+            self._pool.submit(_transcribe_chunk, audio[s:e], s / SAMPLE_RATE, options)
+            for s, e in bounds
+        ]
+        parts = await asyncio.gather(*[asyncio.wrap_future(f) for f in futures])
+
+        segments = []
+        for part in parts:
+            segments.extend(part["segments"])
+        for i, seg in enumerate(segments):
+            seg["id"] = i
+
+        return {
+            "text": " ".join(p["text"] for p in parts if p["text"]),
+            "language": parts[0]["language"],
+            "segments": segments,
+            "chunks": len(parts),
+        }
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
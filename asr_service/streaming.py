@@ -0,0 +1,187 @@
+# asr_service/streaming.py
+
+"""
+Streaming recognition state for the /asr/stream WebSocket.
+
+The client sends 16-bit little-endian mono PCM frames while the user speaks.
+Every `STEP_SEC` of new audio the current window is re-decoded through the
+shared batcher, and words on which two consecutive hypotheses agree are
+committed (LocalAgreement-2). Committed words are passed back to Whisper as a
+forced decoder prefix, so the stable part of the transcript never flickers;
+only the tentative tail changes between partials.
+
+When the window reaches `MAX_WINDOW_SEC` it slides instead of being reset:
+only the committed words are finalized, and the audio from roughly where they
+end (minus `OVERLAP_SEC`, so a word spanning the cut stays whole) is carried
+into the next window. Finalized words that are decoded again from the overlap
+are recognised by matching them against the end of the finalized text and
+dropped. The finalized text is used as the decoding prompt for context.
+
+Word positions are estimated proportionally (Whisper's batched decode gives no
+word timestamps), so the overlap errs on the generous side. The carried audio
+is capped at half a window; only tentative words whose audio falls before that
+cap are finalized unconfirmed.
+"""
+
+import os
+import re
+
+import numpy as np
+
+from audio_decode import SAMPLE_RATE, Resampler
+
+STEP_SEC = float(os.environ.get("ASR_STREAM_STEP_SEC", 1.0))
+MAX_WINDOW_SEC = float(os.environ.get("ASR_STREAM_MAX_WINDOW_SEC", 25.0))
+# 滑动窗口时在已提交部分末尾之前额外保留的音频
+OVERLAP_SEC = float(os.environ.get("ASR_STREAM_OVERLAP_SEC", 2.0))
+# 位置估计不精确，去重时多保留几个已确定的词用于对齐
+OVERLAP_WORD_MARGIN = 3
+# 提示词只保留最近的上下文，避免占满 Whisper 的 prompt 长度
+PROMPT_CHARS = 200
+
+
+class StreamingSession:
+    def __init__(self, batcher, sample_rate=SAMPLE_RATE, language=None,
+                 step_sec=STEP_SEC, max_window_sec=MAX_WINDOW_SEC, overlap_sec=OVERLAP_SEC):
+        self.batcher = batcher
+        self.sample_rate = sample_rate
+        self.language = language
+        self.step = int(step_sec * SAMPLE_RATE)
+        self.max_window = int(max_window_sec * SAMPLE_RATE)
+        self.overlap = int(overlap_sec * SAMPLE_RATE)
+        self.reset()
+
+    def reset(self):
+        # 有状态重采样：帧边界处连续，不累积取整误差
+        self.resampler = Resampler(self.sample_rate, SAMPLE_RATE)
+        self.window = np.zeros(0, np.float32)
+        self.finalized_text = ""
+        # 以下词列表都以当前窗口音频为准，可能以重叠区内已确定的词开头（前 dup 个）
+        self.committed_words = []
+        self.prev_words = []
+        self.overlap_words = []
+        self.dup = 0
+        self._pending = 0
+
+    def add_pcm(self, data: bytes) -> bool:
+        """
+        Append a PCM frame. Returns True when enough new audio has arrived
+        for another partial hypothesis.
+        """
+        usable = len(data) - len(data) % 2
+        audio = np.frombuffer(data[:usable], "<i2").astype(np.float32) / 32768.0
+        audio = self.resampler.process(audio)
+        self.window = np.concatenate([self.window, audio])
+        self._pending += len(audio)
+        return self._pending >= self.step
+
+    async def partial(self) -> dict:
+        self._pending = 0
+        words = await self._decode(final=False)
+
+        # LocalAgreement-2：两次连续假设的公共前缀即可提交
+        agreed = _common_prefix(self.prev_words, words)
+        if agreed > len(self.committed_words):
+            self.committed_words = words[:agreed]
+        self.prev_words = words
+        self._update_dup(words)
+
+        if len(self.window) >= self.max_window:
+            self._slide_window(words)
+            return self._message("partial", [])
+
+        return self._message("partial", words[max(len(self.committed_words), self.dup):])
+
+    async def finish(self) -> dict:
+        """
+        End of utterance: decode the remaining window and return the final transcript.
+        """
+        # 取出重采样器中尚未输出的尾部样本
+        self.window = np.concatenate([self.window, self.resampler.flush()])
+        if len(self.window):
+            words = await self._decode(final=True)
+            self._update_dup(words)
+            self._finalize(words[self.dup:])
+        message = {"type": "final", "text": self.finalized_text}
+        self.reset()
+        return message
+
+    # ---------------- internals ----------------
+
+    async def _decode(self, final):
+        options = {}
+        if self.language:
+            options["language"] = self.language
+        if self.committed_words:
+            options["prefix"] = " ".join(self.committed_words)
+        if self.finalized_text:
+            options["prompt"] = self.finalized_text[-PROMPT_CHARS:]
+
+        # partial 结果不做温度回退，保证低延迟
+        result = await self.batcher.transcribe(self.window, fallback=final, **options)
+        return self.committed_words + result["text"].split()
+
+    def _update_dup(self, words):
+        # 窗口开头与已确定文本末尾重合的词数（重叠区被再次识别出的词）
+        self.dup = _overlap(self.overlap_words, words)
+
+    def _slide_window(self, words):
+        """
+        Finalize the committed words and keep the audio after them (plus
+        `overlap`) as the start of the next window.
+        """
+        n_words, n_samples = len(words), len(self.window)
+        committed = len(self.committed_words)
+        # 按词数比例估计已提交部分在音频中的结束位置
+        committed_end = n_samples * committed // n_words if n_words else 0
+        cut = max(0, committed_end - self.overlap)
+        # 保留的音频最多半个窗口，保证窗口在长时间没有共识时也能前进
+        cut = max(cut, n_samples - self.max_window // 2)
+
+        first_kept = n_words * cut // n_samples
+        # 被丢弃的音频里若还有未确认的词，只能按当前假设确定下来
+        finalize_to = max(committed, first_kept)
+        finalized = self.overlap_words + words[self.dup:finalize_to]
+        self._finalize(words[self.dup:finalize_to])
+        # 已确定、但音频仍留在新窗口里的词，供下一窗口去重
+        carried = max(0, finalize_to - first_kept) + OVERLAP_WORD_MARGIN
+        self.overlap_words = finalized[-carried:]
+
+        self.window = self.window[cut:]
+        self.committed_words = []
+        self.prev_words = []
+        self.dup = 0
+
+    def _finalize(self, words):
+        text = " ".join(words)
+        self.finalized_text = f"{self.finalized_text} {text}".strip()
+
+    def _message(self, kind, tentative):
+        committed = " ".join([self.finalized_text] + self.committed_words[self.dup:]).strip()
+        return {"type": kind, "committed": committed, "tentative": " ".join(tentative)}
+
+
+def _normalize(word):
+    return re.sub(r"[^\w']", "", word.lower())
+
+
+def _overlap(finalized_tail, words):
+    """
+    Length of the longest suffix of `finalized_tail` that `words` starts with,
+    ignoring case and punctuation.
+    """
+    tail = [_normalize(w) for w in finalized_tail]
+    head = [_normalize(w) for w in words[:len(tail)]]
+    for k in range(min(len(tail), len(head)), 0, -1):
+        if tail[-k:] == head[:k]:
+            return k
+    return 0
+
+
+def _common_prefix(a, b):
+    n = 0
+    for x, y in zip(a, b):
+        if x != y:
+            break
+        n += 1
+    return n
@@ -0,0 +1,124 @@
+# asr_service/transcript_cache.py
+
+"""
+Content-hash transcript cache.
+
+Keys are a SHA-256 over the decoded PCM plus the model name and the decoding
+options, so the same clip re-sent by the gateway (reruns, retries, replayed
+test clips) is answered without touching the model. Entries live in a bounded
+LRU with a TTL and can optionally be persisted to a JSON file.
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+MAX_ENTRIES = int(os.environ.get("ASR_CACHE_MAX_ENTRIES", 1024))
+TTL_SEC = float(os.environ.get("ASR_CACHE_TTL_SEC", 24 * 3600))
+# 为空则只做内存缓存
+PERSIST_PATH = os.environ.get("ASR_CACHE_PATH", "")
+SAVE_EVERY = 20
+
+
+class TranscriptCache:
+    def __init__(self, max_entries=MAX_ENTRIES, ttl_sec=TTL_SEC, persist_path=PERSIST_PATH):
+        self.max_entries = max_entries
+        self.ttl_sec = ttl_sec
+        self.persist_path = persist_path or None
+
+        self._data = OrderedDict()  # key -> (created_at, value)
+        self._lock = threading.Lock()
+        self._unsaved = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+        if self.persist_path:
+            self._load()
+
+    @staticmethod
+    def make_key(audio: np.ndarray, model_name: str, options: dict) -> str:
+        h = hashlib.sha256()
+        h.update(np.ascontiguousarray(audio, dtype=np.float32).tobytes())
+        h.update(model_name.encode())
+        h.update(json.dumps(options, sort_keys=True, default=str).encode())
+        return h.hexdigest()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and time.time() - entry[0] > self.ttl_sec:
+                del self._data[key]
+                self.expirations += 1
+                entry = None
+
+            if entry is None:
+                self.misses += 1
+                return None
+
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, value):
+        with self._lock:
+            self._data[key] = (time.time(), value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+                self.evictions += 1
+            self._unsaved += 1
+            should_save = self.persist_path and self._unsaved >= SAVE_EVERY
+
+        if should_save:
+            self.save()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._data),
+                "max_entries": self.max_entries,
+                "ttl_sec": self.ttl_sec,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "persist_path": self.persist_path,
+            }
+
+    def save(self):
+        if not self.persist_path:
+            return
+        with self._lock:
+            snapshot = [[k, t, v] for k, (t, v) in self._data.items()]
+            self._unsaved = 0
+
+        tmp_path = f"{self.persist_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(snapshot, f, ensure_ascii=False)
+        os.replace(tmp_path, self.persist_path)
+
+    def _load(self):
+        if not os.path.exists(self.persist_path):
+            return
+        try:
+            with open(self.persist_path, "r", encoding="utf-8") as f:
+                snapshot = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Ignoring unreadable transcript cache {self.persist_path}: {e}")
+            return
+
+        now = time.time()
+        for key, created_at, value in snapshot[-self.max_entries:]:
+            if now - created_at <= self.ttl_sec:
+                self._data[key] = (created_at, value)
+        print(f"Loaded {len(self._data)} cached transcripts from {self.persist_path}")
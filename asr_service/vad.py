@@ -0,0 +1,112 @@
+# asr_service/vad.py
+
+"""
+Energy-based voice activity detection, vectorized in NumPy.
+
+Audio is cut into fixed frames, the per-frame energy (dBFS) is compared with a
+threshold derived from the clip's own noise floor, and the resulting speech
+mask is cleaned up (short clicks dropped, speech padded with a hangover).
+`trim_silence` then removes leading/trailing silence and collapses long
+internal pauses, so Whisper only sees the part of the recording with speech.
+"""
+
+import os
+
+import numpy as np
+
+from audio_decode import SAMPLE_RATE
+
+FRAME_MS = 30
+# 阈值 = max(min(噪声底 + MARGIN_DB, 峰值 - PEAK_HEADROOM_DB), ABS_THRESHOLD_DB)
+MARGIN_DB = float(os.environ.get("ASR_VAD_MARGIN_DB", 10.0))
+ABS_THRESHOLD_DB = float(os.environ.get("ASR_VAD_ABS_THRESHOLD_DB", -50.0))
+PEAK_HEADROOM_DB = 20.0
+MIN_SPEECH_MS = 90
+PAD_MS = 210
+MAX_PAUSE_MS = int(os.environ.get("ASR_VAD_MAX_PAUSE_MS", 600))
+
+
+def frame_energy_db(audio: np.ndarray, frame_len: int) -> np.ndarray:
+    n_frames = len(audio) // frame_len
+    frames = audio[: n_frames * frame_len].reshape(n_frames, frame_len)
+    return 10.0 * np.log10(np.mean(frames * frames, axis=1) + 1e-10)
+
+
+def speech_mask(audio: np.ndarray, sr: int = SAMPLE_RATE, frame_ms: int = FRAME_MS,
+                margin_db: float = MARGIN_DB, abs_threshold_db: float = ABS_THRESHOLD_DB,
+                min_speech_ms: int = MIN_SPEECH_MS, pad_ms: int = PAD_MS) -> np.ndarray:
+    """
+    Per-frame boolean speech mask.
+    """
+    frame_len = sr * frame_ms // 1000
+    energy = frame_energy_db(audio, frame_len)
+    if len(energy) == 0:
+        return np.zeros(0, dtype=bool)
+
+    noise_floor = np.percentile(energy, 10)
+    # 全程有声时噪声底接近语音电平，因此阈值不超过峰值以下 PEAK_HEADROOM_DB
+    threshold = max(min(noise_floor + margin_db, energy.max() - PEAK_HEADROOM_DB), abs_threshold_db)
+    mask = energy > threshold
+
+    # 去掉过短的能量突起（按键声、爆音）
+    min_frames = max(1, min_speech_ms // frame_ms)
+    starts, ends = _runs(mask)
+    for s, e in zip(starts, ends):
+        if e - s < min_frames:
+            mask[s:e] = False
+
+    # 前后各保留 pad_ms 的拖尾，避免截断辅音
+    pad = pad_ms // frame_ms
+    if pad and mask.any():
+        mask = np.convolve(mask, np.ones(2 * pad + 1), mode="same") > 0
+
+    return mask
+
+
+def trim_silence(audio: np.ndarray, sr: int = SAMPLE_RATE, frame_ms: int = FRAME_MS,
+                 max_pause_ms: int = MAX_PAUSE_MS, **kwargs):
+    """
+    Trim leading/trailing silence and collapse internal pauses longer than max_pause_ms.
+    :return: (trimmed audio, stats dict)
+    """
+    frame_len = sr * frame_ms // 1000
+    mask = speech_mask(audio, sr=sr, frame_ms=frame_ms, **kwargs)
+
+    stats = {"input_sec": round(len(audio) / sr, 3), "speech": bool(mask.any())}
+    if not stats["speech"]:
+        stats.update(output_sec=0.0, removed_sec=stats["input_sec"])
+        return audio[:0], stats
+
+    keep = mask.copy()
+    max_pause = max_pause_ms // frame_ms
+    starts, ends = _runs(~mask)
+    for s, e in zip(starts, ends):
+        if s == 0 or e == len(mask):
+            continue  # 首尾静音整体丢弃
+        if e - s > max_pause:
+            # 长停顿压缩为 max_pause：保留前后各一半
+            head = max_pause // 2
+            keep[s:s + head] = True
+            keep[e - (max_pause - head):e] = True
+        else:
+            keep[s:e] = True
+
+    sample_keep = np.repeat(keep, frame_len)
+    # 末尾不足一帧的样本跟随最后一帧
+    tail = len(audio) - len(sample_keep)
+    if tail > 0:
+        sample_keep = np.concatenate([sample_keep, np.full(tail, keep[-1])])
+    trimmed = audio[sample_keep]
+
+    stats["output_sec"] = round(len(trimmed) / sr, 3)
+    stats["removed_sec"] = round(stats["input_sec"] - stats["output_sec"], 3)
+    return trimmed, stats
+
+
+def _runs(mask: np.ndarray):
+    """
+    Start/end indices of True runs in a boolean array.
+    """
+    padded = np.concatenate([[False], mask, [False]]).astype(np.int8)
+    diff = np.diff(padded)
+    return np.flatnonzero(diff == 1), np.flatnonzero(diff == -1)
@@ -1,15 +1,26 @@
 import os
 import time
-import requests
+import uuid
 import streamlit as st
+from concurrent.futures import ThreadPoolExecutor
 from io import BytesIO
 from audiorecorder import audiorecorder
+from playback import enqueue_audio, stop_playback
+from service_client import ServiceClient, ServiceError
 
 # ================= Configuration =================
 # Backend Service URLs (Hardcoded for production)
 DEFAULT_ASR_URL = "http://localhost:8001/asr"
 DEFAULT_LLM_URL = "http://localhost:8002/llm"
 DEFAULT_TTS_URL = "http://localhost:8003/tts"
+# Compressed TTS audio keeps transfers and the chat history in session state small
+# (wav / flac / mp3 / ogg)
+DEFAULT_TTS_FORMAT = "mp3"
+
+# Pipelined turns: each sentence of the streamed LLM reply is sent to TTS as soon
+# as it is complete and played back in order while later sentences are generated
+PIPELINED_TURNS = True
+TTS_CONCURRENCY = 3
 
 # Directory configuration
 OUTPUT_DIR = "output"
@@ -37,24 +48,33 @@ def get_avatar_image():
     return avatar_path if os.path.exists(avatar_path) else "🐙"
 
 
-def call_service(url, payload, file_mode=False):
+@st.cache_resource
+def get_client():
+    """
+    One pooled keep-alive client shared across reruns and browser sessions.
+    """
+    return ServiceClient(DEFAULT_ASR_URL, DEFAULT_LLM_URL, DEFAULT_TTS_URL)
+
+
+def call_asr_service(audio_bytes):
     """
-    Unified function to call ASR or LLM services.
-    :param url: Service API URL
-    :param payload: Audio bytes (for ASR) or Text string (for LLM)
-    :param file_mode: Boolean, True for file upload (ASR), False for JSON (LLM)
+    Speech to text. Returns the transcript or None on failure.
     """
     try:
-        if file_mode:
-            # ASR: Upload audio file
-            files = {"file": ("audio.wav", payload, "audio/wav")}
-            resp = requests.post(url, files=files, timeout=15)
-            return resp.json().get("text", "") if resp.status_code == 200 else None
-        else:
-            # LLM: Send text payload
-            resp = requests.post(url, json={"text": payload}, timeout=60)
-            return resp.json().get("reply", "") if resp.status_code == 200 else None
-    except Exception as e:
+        return get_client().transcribe(audio_bytes)
+    except ServiceError as e:
+        st.error(f"Connection Failed: {e}")
+        return None
+
+
+def call_llm_service(text):
+    """
+    Send the user text with this browser session's conversation id.
+    Returns the reply or None on failure.
+    """
+    try:
+        return get_client().chat(text, get_session_id())
+    except ServiceError as e:
         st.error(f"Connection Failed: {e}")
         return None
 
@@ -62,17 +82,94 @@ def call_service(url, payload, file_mode=False):
 def call_tts_service(text):
     """
     Call the TTS service to generate audio.
-    Expects binary audio content in response.
+    Returns (audio bytes, media type) or None.
     """
     try:
-        # TTS usually expects form data or json, here assuming form data based on previous context
-        resp = requests.post(DEFAULT_TTS_URL, data={"text": text}, timeout=60)
-        return resp.content if resp.status_code == 200 else None
-    except Exception as e:
+        return get_client().synthesize(text, DEFAULT_TTS_FORMAT)
+    except ServiceError as e:
         st.error(f"TTS Failed: {e}")
         return None
 
 
+@st.cache_resource
+def get_tts_pool():
+    """
+    Worker threads for per-sentence TTS calls, shared across reruns.
+    """
+    return ThreadPoolExecutor(max_workers=TTS_CONCURRENCY, thread_name_prefix="gateway-tts")
+
+
+def run_pipelined_turn(user_text, t_turn_start, bot_avatar):
+    """
+    Stream the LLM reply, dispatch every complete sentence to TTS right away
+    and queue the clips for in-order playback while later sentences are still
+    being generated and synthesized.
+    Returns the assistant message dict, or None on failure.
+    """
+    client = get_client()
+    pool = get_tts_pool()
+    turn_id = uuid.uuid4().hex
+    sentences, futures, segments = [], [], []
+    reply = None
+    ttfa = None
+
+    def play_ready(block=False):
+        # Clips are queued strictly in sentence order; later ones wait for earlier ones
+        nonlocal ttfa
+        while len(segments) < len(futures) and (block or futures[len(segments)].done()):
+            index = len(segments)
+            try:
+                audio = futures[index].result()
+            except ServiceError as e:
+                # ServiceClient 把所有请求 / 响应错误都转换为 ServiceError
+                st.warning(f"TTS Failed for sentence {index + 1}: {e}")
+                audio = None
+            segments.append(audio)
+            if audio:
+                if ttfa is None:
+                    ttfa = time.time() - t_turn_start
+                enqueue_audio(audio[0], audio[1], f"{turn_id}-{index}")
+
+    with st.chat_message("assistant", avatar=bot_avatar):
+        text_slot = st.empty()
+        try:
+            for event, data in client.stream_chat(user_text, get_session_id()):
+                if event == "sentence":
+                    sentences.append(data["text"])
+                    text_slot.write(" ".join(sentences))
+                    futures.append(pool.submit(client.synthesize, data["text"], DEFAULT_TTS_FORMAT))
+                elif event == "done":
+                    reply = data["reply"]
+                elif event == "error":
+                    st.error(f"LLM Failed: {data.get('detail')}")
+                # Token events arrive continuously, so finished clips start playing promptly
+                play_ready()
+        except ServiceError as e:
+            st.error(f"Connection Failed: {e}")
+        play_ready(block=True)
+
+    if reply is None:
+        return None
+
+    print(f"Turn finished in {time.time() - t_turn_start:.2f} s, "
+          f"time to first audio: {'n/a' if ttfa is None else f'{ttfa:.2f} s'}")
+    return {
+        "role": "assistant",
+        "content": reply,
+        "audio_segments": [audio for audio in segments if audio],
+        "ttfa": ttfa,
+    }
+
+
+def get_session_id():
+    """
+    Conversation id sent to the LLM service, one per chat (reset by Clear Chat).
+    """
+    if "session_id" not in st.session_state:
+        st.session_state.session_id = uuid.uuid4().hex
+    return st.session_state.session_id
+
+
 def init_chat_history():
     """
     Initialize chat history with a system greeting if not present.
@@ -93,6 +190,8 @@ def clear_chat():
     """
     if "messages" in st.session_state:
         del st.session_state.messages
+    if "session_id" in st.session_state:
+        del st.session_state.session_id
 
 
 # ================= Main UI =================
@@ -116,7 +215,11 @@ def main():
             with st.chat_message(msg["role"], avatar=avatar):
                 st.write(msg["content"])
                 if "audio" in msg:
-                    st.audio(msg["audio"], format="audio/wav")
+                    st.audio(msg["audio"], format=msg.get("audio_format", "audio/wav"))
+                for segment, media_type in msg.get("audio_segments", []):
+                    st.audio(segment, format=media_type)
+                if msg.get("ttfa") is not None:
+                    st.caption(f"First audio after {msg['ttfa']:.2f} s")
 
     st.markdown("###")
 
@@ -176,17 +279,31 @@ def main():
             with open(save_path, "wb") as f:
                 f.write(audio_bytes)
 
+            t_turn_start = time.time()
+
             # UI Feedback: Toast notification
             st.toast("Processing Pipeline...", icon="⏳")
+            stop_playback()
 
             # Step 1: ASR (Speech to Text)
-            user_text = call_service(DEFAULT_ASR_URL, audio_bytes, file_mode=True)
+            user_text = call_asr_service(audio_bytes)
 
             if user_text:
                 st.session_state.messages.append({"role": "user", "content": user_text})
 
+                if PIPELINED_TURNS:
+                    # Steps 2 + 3 overlapped: streamed LLM sentences -> TTS -> ordered playback
+                    with chat_container:
+                        with st.chat_message("user", avatar="🧑‍💻"):
+                            st.write(user_text)
+                        msg_data = run_pipelined_turn(user_text, t_turn_start, bot_avatar)
+                    if msg_data:
+                        st.session_state.messages.append(msg_data)
+                        st.rerun()
+                    return
+
                 # Step 2: LLM (Text Generation)
-                bot_reply = call_service(DEFAULT_LLM_URL, user_text, file_mode=False)
+                bot_reply = call_llm_service(user_text)
 
                 if bot_reply:
                     # Step 3: TTS (Text to Speech)
@@ -195,7 +312,7 @@ def main():
                     # Append Assistant Response
                     msg_data = {"role": "assistant", "content": bot_reply}
                     if tts_audio:
-                        msg_data["audio"] = tts_audio
+                        msg_data["audio"], msg_data["audio_format"] = tts_audio
 
                     st.session_state.messages.append(msg_data)
                     st.rerun()
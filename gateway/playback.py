@@ -0,0 +1,70 @@
+"""
+Ordered, progressive audio playback in the browser.
+
+Each synthesized segment is injected as a zero-height HTML component whose
+script appends the clip to one queue on the parent page and starts the
+player if it is idle. The queue and player live in the parent window's JS
+realm, so playback carries on in order while Streamlit keeps rendering and
+after the component iframes are gone (e.g. on st.rerun).
+"""
+
+import base64
+import json
+
+import streamlit.components.v1 as components
+
+# 播放器定义在父页面中，只在第一次注入时创建
+_PLAYER_JS = """
+window.__ttsPlayer = window.__ttsPlayer || {
+    queue: [],
+    seen: new Set(),
+    current: null,
+    next: function () {
+        var p = window.__ttsPlayer;
+        if (p.current || !p.queue.length) return;
+        p.current = new Audio(p.queue.shift());
+        var done = function () { p.current = null; p.next(); };
+        p.current.onended = done;
+        p.current.onerror = done;
+        p.current.play().catch(done);
+    },
+    stop: function () {
+        var p = window.__ttsPlayer;
+        p.queue = [];
+        if (p.current) { p.current.pause(); p.current = null; }
+    }
+};
+"""
+
+
+def enqueue_audio(audio_bytes, media_type, segment_id):
+    """
+    Queue one clip for playback after everything queued before it.
+    `segment_id` must be unique; a clip already queued is never replayed.
+    """
+    src = f"data:{media_type};base64,{base64.b64encode(audio_bytes).decode()}"
+    script = f"""
+<script>
+(function () {{
+    var w = window.parent;
+    w.eval({json.dumps(_PLAYER_JS)});
+    var p = w.__ttsPlayer;
+    var id = {json.dumps(segment_id)};
+    if (p.seen.has(id)) return;
+    p.seen.add(id);
+    p.queue.push({json.dumps(src)});
+    p.next();
+}})();
+</script>
+"""
+    components.html(script, height=0)
+
+
+def stop_playback():
+    """
+    Drop queued clips and stop the current one (e.g. when a new turn starts).
+    """
+    components.html(
+        "<script>var p = window.parent.__ttsPlayer; if (p) { p.stop(); }</script>",
+        height=0,
+    )
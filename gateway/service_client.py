@@ -0,0 +1,253 @@
+"""
+HTTP client for the ASR / LLM / TTS backends.
+
+One keep-alive connection pool (requests.Session) is shared by every stage;
+the gateway caches a single ServiceClient across Streamlit reruns, so a turn
+reuses open connections instead of paying TCP setup per call.
+
+Failure handling:
+- Per-stage (connect, read) timeouts.
+- Bounded retries with exponential backoff and full jitter. Only for calls
+  that are safe to repeat: ASR and TTS are pure functions of their input.
+  The LLM call appends to the conversation, so it is only retried when the
+  request provably did not run: the connection could not be established,
+  or the service answered 429 / 503, which the LLM service returns before
+  touching the session.
+- A circuit breaker per backend. After `failure_threshold` consecutive
+  failures, calls fail fast for `reset_timeout` seconds. Then one trial call
+  is let through (half-open).
+"""
+
+import json
+import os
+import random
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import NewConnectionError
+
+# (connect, read) timeouts per stage, in seconds
+TIMEOUTS = {
+    "asr": (3.05, float(os.environ.get("GATEWAY_ASR_TIMEOUT", 15))),
+    "llm": (3.05, float(os.environ.get("GATEWAY_LLM_TIMEOUT", 60))),
+    "tts": (3.05, float(os.environ.get("GATEWAY_TTS_TIMEOUT", 60))),
+}
+MAX_RETRIES = int(os.environ.get("GATEWAY_MAX_RETRIES", 2))
+BACKOFF_BASE_SEC = 0.25
+BACKOFF_MAX_SEC = 4.0
+FAILURE_THRESHOLD = int(os.environ.get("GATEWAY_BREAKER_FAILURES", 5))
+RESET_TIMEOUT_SEC = float(os.environ.get("GATEWAY_BREAKER_RESET_SEC", 30))
+POOL_SIZE = 16
+
+# 服务尚未就绪 / 过载 / 网关错误，可重试
+RETRYABLE_STATUS = {429, 502, 503, 504}
+# 对非幂等调用，只有这些状态码能确定请求未被处理
+REJECTED_STATUS = {429, 503}
+
+
+class ServiceError(Exception):
+    def __init__(self, stage, message, status_code=None):
+        super().__init__(f"{stage.upper()}: {message}")
+        self.stage = stage
+        self.status_code = status_code
+
+
+class CircuitOpenError(ServiceError):
+    pass
+
+
+class CircuitBreaker:
+    def __init__(self, failure_threshold=FAILURE_THRESHOLD, reset_timeout=RESET_TIMEOUT_SEC):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._state()
+
+    def allow(self):
+        with self._lock:
+            state = self._state()
+            if state == "closed":
+                return True
+            if state == "half_open" and not self._trial_running:
+                self._trial_running = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._trial_running = False
+            if self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+
+    def _state(self):
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half_open"
+        return "open"
+
+
+class ServiceClient:
+    def __init__(self, asr_url, llm_url, tts_url, timeouts=None, max_retries=MAX_RETRIES):
+        self.urls = {"asr": asr_url, "llm": llm_url, "tts": tts_url}
+        self.timeouts = {**TIMEOUTS, **(timeouts or {})}
+        self.max_retries = max_retries
+        self.breakers = {stage: CircuitBreaker() for stage in self.urls}
+
+        # 重试由本模块控制，关闭 urllib3 自带的重试
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=len(self.urls), pool_maxsize=POOL_SIZE, max_retries=0)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    # ---------------- stages ----------------
+
+    def transcribe(self, audio_bytes, filename="audio.wav", content_type="audio/wav"):
+        resp = self._post("asr", idempotent=True, files={"file": (filename, audio_bytes, content_type)})
+        return _json("asr", resp).get("text", "")
+
+    def chat(self, text, session_id):
+        # 服务端截止时间比本地读超时略短，超时后服务端停止生成
+        deadline = max(1.0, self.timeouts["llm"][1] - 2)
+        resp = self._post(
+            "llm",
+            idempotent=False,
+            json={"text": text, "session_id": session_id},
+            headers={"X-Request-Timeout": f"{deadline:g}"},
+        )
+        return _json("llm", resp).get("reply", "")
+
+    def stream_chat(self, text, session_id):
+        """
+        Yields (event, data) pairs from the LLM's SSE endpoint as they arrive:
+        "token", "sentence" ({"index", "text"}), then "done" or "error".
+        Retried like `chat`, i.e. only before the stream has started.
+        """
+        deadline = max(1.0, self.timeouts["llm"][1] - 2)
+        resp = self._post(
+            "llm",
+            idempotent=False,
+            url=self.urls["llm"].rstrip("/") + "/stream",
+            json={"text": text, "session_id": session_id},
+            headers={"X-Request-Timeout": f"{deadline:g}"},
+            stream=True,
+        )
+        # text/event-stream 没有声明 charset 时 requests 默认按 ISO-8859-1 解码
+        resp.encoding = "utf-8"
+        event, data = None, []
+        try:
+            for line in resp.iter_lines(decode_unicode=True):
+                if line.startswith("event:"):
+                    event = line[len("event:"):].strip()
+                elif line.startswith("data:"):
+                    data.append(line[len("data:"):].lstrip())
+                elif not line and data:
+                    yield event or "message", json.loads("\n".join(data))
+                    event, data = None, []
+        except (requests.exceptions.RequestException, ValueError) as e:
+            # 服务端中途退出：连接断开 / 分块编码不完整 / data 行被截断
+            self.breakers["llm"].record_failure()
+            raise ServiceError("llm", f"stream interrupted ({e})")
+        finally:
+            resp.close()
+
+    def synthesize(self, text, fmt="wav"):
+        """
+        Returns (audio bytes, media type).
+        """
+        resp = self._post("tts", idempotent=True, data={"text": text, "format": fmt})
+        return resp.content, resp.headers.get("content-type", "audio/wav")
+
+    def circuit_states(self):
+        return {stage: breaker.state for stage, breaker in self.breakers.items()}
+
+    # ---------------- internals ----------------
+
+    def _post(self, stage, idempotent, url=None, **kwargs):
+        breaker = self.breakers[stage]
+        attempt = 0
+        while True:
+            if not breaker.allow():
+                raise CircuitOpenError(stage, "service unavailable (circuit open), try again shortly")
+
+            retry_after = None
+            try:
+                resp = self.session.post(url or self.urls[stage], timeout=self.timeouts[stage], **kwargs)
+            except requests.exceptions.RequestException as e:
+                # 包括响应体读到一半连接断开（ChunkedEncodingError）等情况；
+                # 必须记录失败，否则半开状态的试探请求永远不会结束
+                breaker.record_failure()
+                error, retryable = ServiceError(stage, f"request failed ({e})"), idempotent or _not_sent(e)
+            else:
+                if resp.status_code < 400:
+                    breaker.record_success()
+                    return resp
+                # 4xx 是请求本身的问题，不计入熔断
+                if resp.status_code >= 500:
+                    breaker.record_failure()
+                else:
+                    breaker.record_success()
+                error = ServiceError(stage, f"HTTP {resp.status_code}: {_detail(resp)}", resp.status_code)
+                retryable_status = RETRYABLE_STATUS if idempotent else REJECTED_STATUS
+                retryable = resp.status_code in retryable_status
+                retry_after = _retry_after(resp)
+
+            if not retryable or attempt >= self.max_retries:
+                raise error
+            time.sleep(_backoff(attempt, retry_after))
+            attempt += 1
+
+
+def _backoff(attempt, retry_after=None):
+    # 指数退避 + full jitter；服务端给了 Retry-After 时以它为下限
+    delay = random.uniform(0, min(BACKOFF_MAX_SEC, BACKOFF_BASE_SEC * 2 ** attempt))
+    if retry_after is not None:
+        delay = max(delay, min(retry_after, BACKOFF_MAX_SEC))
+    return delay
+
+
+def _not_sent(exc):
+    """
+    True when the request never reached the server (connect refused / timed out).
+    """
+    if isinstance(exc, requests.exceptions.ConnectTimeout):
+        return True
+    reason = getattr(exc.args[0], "reason", None) if exc.args else None
+    return isinstance(reason, NewConnectionError)
+
+
+def _json(stage, resp):
+    try:
+        return resp.json()
+    except ValueError:
+        raise ServiceError(stage, f"invalid response body (HTTP {resp.status_code})", resp.status_code)
+
+
+def _retry_after(resp):
+    try:
+        return float(resp.headers["Retry-After"])
+    except (KeyError, ValueError):
+        return None
+
+
+def _detail(resp):
+    try:
+        return resp.json().get("detail", resp.reason)
+    except ValueError:
+        return resp.reason
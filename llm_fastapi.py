@@ -1,14 +1,22 @@
 # main.py
-from fastapi import FastAPI
+import os
+import sys
+from typing import Optional
+from fastapi import FastAPI, HTTPException
 from pydantic import BaseModel
 from model_loader import pipe
 
+# 复用 llm_service 中的会话存储
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "llm_service"))
+from session_store import SessionStore
+
 app = FastAPI()
 
 
 # 请求结构
 class ChatRequest(BaseModel):
     messages: list
+    session_id: Optional[str] = None
 
 
 # 自定义 system prompt
@@ -25,17 +33,21 @@ DEFAULT_SYSTEM_PROMPT = (
     "Do not produce long paragraphs. "
 )
 
-full_messages = [{"role": "system", "content": DEFAULT_SYSTEM_PROMPT}]
+sessions = SessionStore(DEFAULT_SYSTEM_PROMPT, pipe.tokenizer)
 
 
 @app.post("/chat")
 async def chat(req: ChatRequest):
+    try:
+        session_id = SessionStore.validate_id(req.session_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
     user_message = req.messages[0]
 
-    # 附加 system prompt
-    full_messages.append({"role": "user", "content": user_message})
+    messages = sessions.build_messages(session_id, user_message)
 
-    print(full_messages)
+    print(messages)
 
     generation_args = {
         "max_new_tokens": 100,
@@ -43,9 +55,9 @@ async def chat(req: ChatRequest):
         "temperature": 0.2,
     }
 
-    output = pipe(full_messages, **generation_args)
+    output = pipe(messages, **generation_args)
     reply = output[0]["generated_text"]
 
-    full_messages.append({"role": "system", "content": reply})
+    sessions.append_turn(session_id, user_message, reply)
 
-    return {"reply": reply}
\ No newline at end of file
+    return {"reply": reply, "session_id": session_id}
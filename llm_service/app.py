@@ -1,58 +1,430 @@
 # main.py
-from fastapi import FastAPI
+import asyncio
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import JSONResponse, StreamingResponse
 from pydantic import BaseModel
-from llm_loader import pipe
+from transformers import TextIteratorStreamer
+from llm_loader import load_model, load_draft_model, LOAD_MODE, MODEL_PATH
+from assisted import AssistedGenerator
+from generation import ChatGenerator
+from prompts import DEFAULT_SYSTEM_PROMPT
+from response_cache import ResponseCache
+from scheduler import ContinuousBatchingScheduler, QueueFull, RequestCancelled, MAX_QUEUE
+from sentences import SentenceSplitter, split_sentences
+from session_store import SessionStore
+from stopping import CancellationCriteria, SentenceCountCriteria
 import time
 
 app = FastAPI()
 
 
-# 请求结构：只需要 text
+# 请求结构：text + 可选的 session_id（不传则新建会话）+ 可选的 assisted 解码开关
 class LLMPayload(BaseModel):
     text: str
+    session_id: Optional[str] = None
+    assisted: Optional[bool] = None
 
 
-# 自定义 system prompt
-DEFAULT_SYSTEM_PROMPT = (
-    "You are a conversational AI designed for voice output. "
-    "You must respond using only plain natural sentences without any formatting. "
-    "Do not output \\n or newline characters under any circumstances. "
-    "Do not use markdown. Do not use bullet points. Do not use numbered lists. "
-    "Do not output any symbols such as *, -, #, >, :, ;, or backticks. "
-    "Do not start sentences with numbers like 1, 2, 3. "
-    "using natural language like 'for example' or 'another option is', not lists. "
-    "Always output response in plain text only."
-    "Keep your responses concise and no longer than 2–3 sentences. This is important. "
-    "Do not produce long paragraphs. "
-)
+# 模型在后台线程中加载（见 load_models），服务启动后立即响应健康检查；
+# 加载完成前推理接口返回 503
+pipe = None
+draft_model = None
+sessions = None
+generator = None
+scheduler = None
+assisted = None
 
-full_messages = [{"role": "system", "content": DEFAULT_SYSTEM_PROMPT}]
+STARTED_AT = time.time()
+readiness = {"status": "starting", "error": None, "load_sec": None, "warmup_sec": None}
+
+# 报告 ready 前经由调度器跑的预热生成次数（0 表示不预热）
+WARMUP_RUNS = int(os.environ.get("LLM_WARMUP_RUNS", 1))
+WARMUP_TOKENS = 8
+
+# 配置了草稿模型时可用的 assisted 解码（仅贪心，单序列，在独立线程中执行）
+ASSISTED_DEFAULT = os.environ.get("LLM_ASSISTED_DEFAULT", "0") == "1"
+assisted_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="llm-assisted")
+assisted_slots = threading.BoundedSemaphore(MAX_QUEUE)
+
+GENERATION_ARGS = {
+    "max_new_tokens": 100,
+    "temperature": 0.2,
+}
+
+# 常见短句（hello / who are you ...）的回复缓存，命中时完全跳过模型
+response_cache = ResponseCache()
+
+
+# 单个请求的最长处理时间；客户端可用 X-Request-Timeout 头缩短
+MAX_REQUEST_SEC = float(os.environ.get("LLM_MAX_REQUEST_SEC", 120))
+DISCONNECT_POLL_SEC = 0.25
+
+# 回复达到 N 个完整句子即停止生成（0 表示不限制）
+MAX_SENTENCES = int(os.environ.get("LLM_MAX_SENTENCES", 3))
+sentence_stop_stats = {"requests_stopped": 0, "tokens_saved": 0}
+
+
+def load_models():
+    global pipe, draft_model, sessions, generator, scheduler, assisted
+    try:
+        readiness["status"] = "loading"
+        t_start = time.time()
+        pipe = load_model()
+        draft_model = load_draft_model(pipe.tokenizer)
+
+        # 按会话保存历史，并按 token 预算截断
+        sessions = SessionStore(DEFAULT_SYSTEM_PROMPT, pipe.tokenizer)
+
+        # 启动时预填充 system prompt 的 KV-cache，之后每轮从它的副本开始生成
+        generator = ChatGenerator(pipe.model, pipe.tokenizer)
+        generator.warm_up(DEFAULT_SYSTEM_PROMPT)
+
+        # 所有请求共用一个连续批处理生成循环
+        scheduler = ContinuousBatchingScheduler(pipe.model, pipe.tokenizer, prefix_cache=generator.prefix_cache)
+
+        if draft_model is not None:
+            assisted = AssistedGenerator(pipe.model, draft_model, pipe.tokenizer, prefix_cache=generator.prefix_cache)
+        readiness["load_sec"] = round(time.time() - t_start, 3)
+
+        readiness["status"] = "warming_up"
+        t_start = time.time()
+        warm_up(WARMUP_RUNS)
+        readiness["warmup_sec"] = round(time.time() - t_start, 3)
+
+        readiness["status"] = "ready"
+        print(f"LLM ready (load {readiness['load_sec']} s, warm-up {readiness['warmup_sec']} s).")
+    except Exception as e:
+        readiness.update(status="failed", error=repr(e))
+        print(f"LLM model loading failed: {e!r}")
+
+
+def warm_up(runs):
+    """
+    Short greedy generations through the real serving paths (scheduler, and
+    the assisted generator when configured), starting from the prefix cache.
+    """
+    messages = [
+        {"role": "system", "content": DEFAULT_SYSTEM_PROMPT},
+        {"role": "user", "content": "Hello"},
+    ]
+    for _ in range(runs):
+        scheduler.submit(messages, max_new_tokens=WARMUP_TOKENS, do_sample=False).result()
+        if assisted is not None:
+            assisted.generate_chat(messages, WARMUP_TOKENS)
+
+
+def _require_ready():
+    if readiness["status"] != "ready":
+        raise HTTPException(status_code=503, detail=f"LLM not ready ({readiness['status']})",
+                            headers={"Retry-After": "5"})
+
+
+@app.on_event("startup")
+def start_loading():
+    threading.Thread(target=load_models, name="llm-loader", daemon=True).start()
+
+
+@app.get("/health/live")
+async def health_live():
+    # 后台加载失败时进程已无法恢复，报告不存活以便被重启
+    alive = readiness["status"] != "failed"
+    body = {"status": "alive" if alive else "failed", "uptime_sec": round(time.time() - STARTED_AT, 1)}
+    return JSONResponse(body, status_code=200 if alive else 500)
+
+
+@app.get("/health/ready")
+async def health_ready():
+    body = {
+        **readiness,
+        "model": MODEL_PATH,
+        "load_mode": LOAD_MODE,
+        "assisted": assisted is not None,
+        "uptime_sec": round(time.time() - STARTED_AT, 1),
+    }
+    return JSONResponse(body, status_code=200 if readiness["status"] == "ready" else 503)
+
+
+def _cancellation(request: Request):
+    """
+    Deadline propagated from the client (X-Request-Timeout, seconds), capped by MAX_REQUEST_SEC.
+    """
+    timeout = MAX_REQUEST_SEC
+    header = request.headers.get("X-Request-Timeout")
+    if header:
+        try:
+            timeout = min(timeout, float(header))
+        except ValueError:
+            raise HTTPException(status_code=400, detail="X-Request-Timeout must be a number of seconds")
+    return CancellationCriteria(deadline=time.time() + timeout)
+
+
+def _sentence_stop():
+    if not MAX_SENTENCES:
+        return None
+    return SentenceCountCriteria(pipe.tokenizer, MAX_SENTENCES, GENERATION_ARGS["max_new_tokens"])
+
+
+def _finish_reply(reply, sentence_stop):
+    """
+    Record tokens saved and drop anything generated past the last allowed sentence.
+    """
+    if sentence_stop is None:
+        return reply, 0
+    if sentence_stop.triggered:
+        sentence_stop_stats["requests_stopped"] += 1
+        sentence_stop_stats["tokens_saved"] += sentence_stop.tokens_saved
+        print(f"Stopped after {MAX_SENTENCES} sentence(s), saved {sentence_stop.tokens_saved} tokens.")
+    sentences = split_sentences(reply)
+    if len(sentences) > MAX_SENTENCES:
+        reply = " ".join(sentences[:MAX_SENTENCES])
+    return reply, sentence_stop.tokens_saved
+
+
+def _use_assisted(req):
+    wanted = req.assisted if req.assisted is not None else ASSISTED_DEFAULT
+    do_sample = GENERATION_ARGS.get("do_sample", scheduler.default_do_sample)
+    # assisted 路径只在贪心解码下保证输出一致
+    return wanted and assisted is not None and not do_sample
+
+
+def _submit(messages, cancel, sentence_stop=None, streamer=None, use_assisted=False):
+    criteria = [cancel] + ([sentence_stop] if sentence_stop else [])
+    try:
+        if use_assisted:
+            return _submit_assisted(messages, cancel, criteria, streamer)
+        return scheduler.submit(messages, streamer=streamer, stopping_criteria=criteria, **GENERATION_ARGS)
+    except QueueFull as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+
+
+def _submit_assisted(messages, cancel, criteria, streamer):
+    if not assisted_slots.acquire(blocking=False):
+        raise QueueFull(scheduler.retry_after())
+    future = assisted_executor.submit(_run_assisted, messages, cancel, criteria, streamer)
+    future.add_done_callback(lambda _: assisted_slots.release())
+    return future
+
+
+def _run_assisted(messages, cancel, criteria, streamer):
+    if cancel.cancelled:
+        if streamer is not None:
+            streamer.end()
+        raise RequestCancelled("Request cancelled before generation started")
+    return assisted.generate_chat(messages, GENERATION_ARGS["max_new_tokens"],
+                                  stopping_criteria=criteria, streamer=streamer)
+
+
+async def _watch_disconnect(request, cancel):
+    while not cancel.cancelled:
+        if await request.is_disconnected():
+            print("Client disconnected, cancelling generation.")
+            cancel.cancel()
+            return
+        await asyncio.sleep(DISCONNECT_POLL_SEC)
+
+
+def _cache_key(messages):
+    if not response_cache.cacheable(GENERATION_ARGS, scheduler.default_do_sample):
+        return None
+    return response_cache.make_key(messages, GENERATION_ARGS)
 
 
 @app.post("/llm")
-async def chat(req: LLMPayload):
+async def chat(req: LLMPayload, request: Request):
+    _require_ready()
     t_start = time.time()
 
+    try:
+        session_id = SessionStore.validate_id(req.session_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
     user_message = req.text.strip()
 
-    # 附加 system prompt
-    full_messages.append({"role": "user", "content": user_message})
+    messages = sessions.build_messages(session_id, user_message)
 
-    print(full_messages)
+    print(messages)
 
-    generation_args = {
-        "max_new_tokens": 100,
-        "return_full_text": False,
-        "temperature": 0.2,
-    }
+    cache_key = _cache_key(messages)
+    reply = response_cache.get(cache_key) if cache_key else None
+    cached = reply is not None
+    tokens_saved = 0
+
+    if not cached:
+        cancel = _cancellation(request)
+        sentence_stop = _sentence_stop()
+        future = _submit(messages, cancel, sentence_stop, use_assisted=_use_assisted(req))
+        watcher = asyncio.create_task(_watch_disconnect(request, cancel))
+        try:
+            reply = await asyncio.wrap_future(future)
+        except RequestCancelled:
+            reply = None
+        finally:
+            watcher.cancel()
+
+        # 被截断的回复既不返回也不写入会话/缓存
+        if reply is None or cancel.cancelled:
+            print(f"Abandoned after {time.time() - t_start} seconds.")
+            raise HTTPException(status_code=504, detail="Generation deadline exceeded or request cancelled")
 
-    output = pipe(full_messages, **generation_args)
-    reply = output[0]["generated_text"]
+        reply, tokens_saved = _finish_reply(reply, sentence_stop)
+        if cache_key:
+            response_cache.put(cache_key, reply)
 
-    full_messages.append({"role": "system", "content": reply})
+    sessions.append_turn(session_id, user_message, reply)
 
     t_end = time.time()
 
-    print(f"Finished in {t_end - t_start} seconds.")
+    print(f"Finished in {t_end - t_start} seconds (cached={cached}).")
+
+    return {"reply": reply, "session_id": session_id, "cached": cached, "tokens_saved": tokens_saved}
+
+
+@app.post("/llm/stream")
+async def chat_stream(req: LLMPayload, request: Request):
+    """
+    Server-Sent Events variant of /llm:
+    - event "token":    {"text"} for every decoded piece
+    - event "sentence": {"index", "text"} as soon as a sentence is complete
+    - event "done":     {"reply", "session_id"} once generation has finished
+    - event "error":    {"detail"} if the deadline passed or generation failed
+    """
+    _require_ready()
+    try:
+        session_id = SessionStore.validate_id(req.session_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    user_message = req.text.strip()
+    messages = sessions.build_messages(session_id, user_message)
+
+    cache_key = _cache_key(messages)
+    reply = response_cache.get(cache_key) if cache_key else None
+
+    if reply is not None:
+        events = _cached_events(session_id, user_message, reply)
+    else:
+        cancel = _cancellation(request)
+        streamer = TextIteratorStreamer(pipe.tokenizer, skip_prompt=True, skip_special_tokens=True)
+        sentence_stop = _sentence_stop()
+        future = _submit(messages, cancel, sentence_stop, streamer=streamer, use_assisted=_use_assisted(req))
+        events = _stream_events(session_id, user_message, streamer, future, cancel, sentence_stop,
+                                cache_key, time.time())
+
+    return StreamingResponse(
+        events,
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Session-Id": session_id},
+    )
+
+
+def _cached_events(session_id, user_message, reply):
+    yield _sse("token", {"text": reply})
+    for i, sentence in enumerate(split_sentences(reply)):
+        yield _sse("sentence", {"index": i, "text": sentence})
+    sessions.append_turn(session_id, user_message, reply)
+    yield _sse("done", {"reply": reply, "session_id": session_id, "cached": True})
+
+
+def _stream_events(session_id, user_message, streamer, future, cancel, sentence_stop, cache_key, t_start):
+    # 同步生成器，由 Starlette 在线程池中迭代，不阻塞事件循环
+    try:
+        yield from _generated_events(session_id, user_message, streamer, future, cancel, sentence_stop,
+                                     cache_key, t_start)
+    finally:
+        # 客户端断开时生成器被关闭，通知调度器停止这条序列
+        if not future.done():
+            print("Client disconnected, cancelling generation.")
+            cancel.cancel()
+
+
+def _generated_events(session_id, user_message, streamer, future, cancel, sentence_stop, cache_key, t_start):
+    splitter = SentenceSplitter()
+    first_token = True
+    n_sentences = 0
+
+    for piece in streamer:
+        if not piece:
+            continue
+        if first_token:
+            print(f"First token after {time.time() - t_start} seconds.")
+            first_token = False
+        yield _sse("token", {"text": piece})
+
+        for sentence in splitter.feed(piece):
+            if not MAX_SENTENCES or n_sentences < MAX_SENTENCES:
+                yield _sse("sentence", {"index": n_sentences, "text": sentence})
+            n_sentences += 1
+
+    tail = splitter.flush()
+    if tail and (not MAX_SENTENCES or n_sentences < MAX_SENTENCES):
+        yield _sse("sentence", {"index": n_sentences, "text": tail})
+
+    try:
+        reply = future.result()
+    except Exception as e:
+        print(f"Generation failed: {e}")
+        yield _sse("error", {"detail": str(e)})
+        return
+
+    if cancel.cancelled:
+        yield _sse("error", {"detail": "Generation deadline exceeded"})
+        return
+
+    reply, tokens_saved = _finish_reply(reply, sentence_stop)
+    if cache_key:
+        response_cache.put(cache_key, reply)
+    sessions.append_turn(session_id, user_message, reply)
+
+    print(f"Finished in {time.time() - t_start} seconds.")
+
+    yield _sse("done", {"reply": reply, "session_id": session_id, "cached": False, "tokens_saved": tokens_saved})
+
+
+def _sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+@app.delete("/llm/session/{session_id}")
+async def delete_session(session_id: str):
+    _require_ready()
+    try:
+        SessionStore.validate_id(session_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    sessions.delete(session_id)
+    return {"deleted": session_id}
+
+
+@app.get("/llm/scheduler/stats")
+async def scheduler_stats():
+    _require_ready()
+    return {**scheduler.stats(), "sentence_stop": {"max_sentences": MAX_SENTENCES, **sentence_stop_stats}}
+
+
+@app.get("/llm/assisted/stats")
+async def assisted_stats():
+    if assisted is None:
+        return {"enabled": False}
+    return {"enabled": True, "default": ASSISTED_DEFAULT, **assisted.stats()}
+
+
+@app.get("/llm/sessions/stats")
+async def session_stats():
+    _require_ready()
+    return sessions.stats()
+
+
+@app.get("/admin/cache/stats")
+async def cache_stats():
+    return response_cache.stats()
+
 
-    return {"reply": reply}
\ No newline at end of file
+@app.post("/admin/cache/flush")
+async def cache_flush():
+    return {"flushed": response_cache.flush()}
@@ -0,0 +1,191 @@
+# llm_service/assisted.py
+
+"""
+Assisted (speculative) greedy decoding with a small draft model.
+
+Each round the draft model proposes `num_draft_tokens` tokens greedily, and
+the main model scores all of them in a single forward pass. The longest
+prefix on which the main model's own argmax agrees is accepted, plus the main
+model's next token, so every round yields between 1 and k + 1 tokens. Because
+only tokens the main model would have picked itself are kept, the output is
+the same as plain greedy decoding (up to floating-point ties).
+
+Both models keep their own KV-cache; rejected positions are cropped away.
+The main model starts from the system-prompt prefix cache when available.
+"""
+
+import os
+import threading
+import time
+
+import torch
+from transformers import DynamicCache
+
+NUM_DRAFT_TOKENS = int(os.environ.get("LLM_DRAFT_TOKENS", 4))
+
+
+class AssistedGenerator:
+    def __init__(self, model, draft_model, tokenizer, prefix_cache=None, num_draft_tokens=NUM_DRAFT_TOKENS):
+        self.model = model
+        self.draft_model = draft_model
+        self.tokenizer = tokenizer
+        self.prefix_cache = prefix_cache
+        self.num_draft_tokens = num_draft_tokens
+
+        eos = model.generation_config.eos_token_id
+        self.eos_token_ids = set(eos if isinstance(eos, (list, tuple)) else [eos])
+
+        self._lock = threading.Lock()
+        self.proposed = 0
+        self.accepted = 0
+        self.rounds = 0
+        self.generated_tokens = 0
+        self.generation_sec = 0.0
+
+    def generate_chat(self, messages, max_new_tokens=100, stopping_criteria=None, streamer=None, **kwargs):
+        """
+        Same contract as the scheduler: returns the decoded reply.
+        Sampling arguments (temperature, do_sample) are ignored - this path is greedy only.
+        """
+        # 任何一步出错都要结束 streamer，否则读取方会一直阻塞
+        try:
+            if self.prefix_cache is not None:
+                input_ids, past = self.prefix_cache.prepare(messages)
+            else:
+                input_ids = self.tokenizer.apply_chat_template(
+                    messages, add_generation_prompt=True, return_tensors="pt"
+                ).to(self.model.device)
+                past = None
+
+            if streamer is not None:
+                streamer.put(input_ids.cpu())
+            tokens = self.generate(input_ids, max_new_tokens, past, stopping_criteria, streamer)
+        finally:
+            if streamer is not None:
+                streamer.end()
+        return self.tokenizer.decode(tokens, skip_special_tokens=True)
+
+    @torch.no_grad()
+    def generate(self, input_ids, max_new_tokens, past_key_values=None, stopping_criteria=None, streamer=None):
+        """
+        Greedy assisted generation; returns the list of new token ids (without EOS).
+        """
+        t_start = time.perf_counter()
+        seq = input_ids[0].tolist()
+        prompt_len = len(seq)
+        target_cache = past_key_values if past_key_values is not None else DynamicCache()
+        draft_cache = DynamicCache()
+        proposed = accepted = rounds = 0
+
+        # 主模型预填充，得到第一个 token
+        next_token = self._target_argmax(seq, [], target_cache)[0]
+        new_tokens = []
+        done = self._accept(seq, new_tokens, [next_token], max_new_tokens, stopping_criteria, streamer)
+
+        while not done:
+            k = min(self.num_draft_tokens, max_new_tokens - len(new_tokens))
+            drafts = self._draft(seq, draft_cache, k) if k > 0 else []
+
+            # 主模型一次前向验证全部草稿 token
+            preds = self._target_argmax(seq, drafts, target_cache)
+            n = 0
+            while n < len(drafts) and drafts[n] == preds[n]:
+                n += 1
+            step_tokens = drafts[:n] + [preds[n]]
+
+            proposed += len(drafts)
+            accepted += n
+            rounds += 1
+
+            # 丢弃未被接受位置的 cache
+            target_cache.crop(len(seq) + n)
+            if draft_cache.get_seq_length() > len(seq) + n:
+                draft_cache.crop(len(seq) + n)
+
+            done = self._accept(seq, new_tokens, step_tokens, max_new_tokens, stopping_criteria, streamer)
+
+        with self._lock:
+            self.proposed += proposed
+            self.accepted += accepted
+            self.rounds += rounds
+            self.generated_tokens += len(seq) - prompt_len
+            self.generation_sec += time.perf_counter() - t_start
+
+        return [t for t in new_tokens if t not in self.eos_token_ids]
+
+    def stats(self):
+        with self._lock:
+            return {
+                "num_draft_tokens": self.num_draft_tokens,
+                "rounds": self.rounds,
+                "proposed": self.proposed,
+                "accepted": self.accepted,
+                "acceptance_rate": round(self.accepted / self.proposed, 4) if self.proposed else 0.0,
+                "tokens_per_round": round(self.generated_tokens / self.rounds, 3) if self.rounds else 0.0,
+                "effective_tokens_per_sec": (round(self.generated_tokens / self.generation_sec, 2)
+                                             if self.generation_sec else 0.0),
+            }
+
+    # ---------------- internals ----------------
+
+    def _target_argmax(self, seq, drafts, cache):
+        """
+        Feed every token not yet in the main model's cache plus the drafts;
+        return the main model's argmax after seq[-1], d1, ..., dk.
+        """
+        cached = cache.get_seq_length()
+        new = seq[cached:] + drafts
+        logits = self._forward(self.model, new, cached, cache)
+        return logits[0, -(len(drafts) + 1):].argmax(dim=-1).tolist()
+
+    def _draft(self, seq, cache, k):
+        drafts = []
+        pending = seq[cache.get_seq_length():]
+        for _ in range(k):
+            logits = self._forward(self.draft_model, pending, cache.get_seq_length(), cache)
+            token = int(logits[0, -1].argmax())
+            drafts.append(token)
+            if token in self.eos_token_ids:
+                break
+            pending = [token]
+        return drafts
+
+    @staticmethod
+    def _forward(model, tokens, cached, cache):
+        device = model.device
+        ids = torch.tensor([tokens], device=device)
+        out = model(
+            input_ids=ids,
+            attention_mask=torch.ones(1, cached + len(tokens), dtype=torch.long, device=device),
+            past_key_values=cache,
+            cache_position=torch.arange(cached, cached + len(tokens), device=device),
+            use_cache=True,
+        )
+        return out.logits
+
+    def _accept(self, seq, new_tokens, step_tokens, max_new_tokens, stopping_criteria, streamer):
+        """
+        Append accepted tokens one by one so EOS, max_new_tokens and stopping
+        criteria cut the output exactly where plain generation would.
+        """
+        for token in step_tokens:
+            seq.append(token)
+            new_tokens.append(token)
+            if token in self.eos_token_ids:
+                return True
+            if streamer is not None:
+                streamer.put(torch.tensor([token]))
+            if len(new_tokens) >= max_new_tokens:
+                return True
+            if stopping_criteria and self._criteria_met(seq, stopping_criteria):
+                return True
+        return False
+
+    @staticmethod
+    def _criteria_met(seq, stopping_criteria):
+        ids = torch.tensor([seq])
+        for criterion in stopping_criteria:
+            result = criterion(ids, None)
+            if bool(result.all()) if torch.is_tensor(result) else bool(result):
+                return True
+        return False
@@ -0,0 +1,69 @@
+# llm_service/bench_assisted.py
+"""
+Benchmark: assisted (draft-model) decoding vs. plain greedy generation.
+
+    LLM_DRAFT_MODEL=<draft model path> python bench_assisted.py [--max-new-tokens 100] [--draft-tokens 4]
+
+Reports tokens/sec for both paths, the draft acceptance rate, and checks that
+assisted outputs are identical to plain greedy outputs.
+"""
+
+import argparse
+import time
+
+from prompts import DEFAULT_SYSTEM_PROMPT
+from assisted import AssistedGenerator
+from llm_loader import load_model, load_draft_model, DRAFT_MODEL_PATH
+
+PROMPTS = [
+    "Hello, who are you?",
+    "What do you think about jellyfishing?",
+    "Can you recommend a good book?",
+    "Tell me about your clarinet.",
+    "Why are you always so grumpy?",
+]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--max-new-tokens", type=int, default=100)
+    parser.add_argument("--draft-tokens", type=int, default=4)
+    args = parser.parse_args()
+
+    if not DRAFT_MODEL_PATH:
+        raise SystemExit("Set LLM_DRAFT_MODEL to the draft model path first.")
+
+    pipe = load_model()
+    draft_model = load_draft_model(pipe.tokenizer)
+    model, tokenizer = pipe.model, pipe.tokenizer
+    assisted = AssistedGenerator(model, draft_model, tokenizer, num_draft_tokens=args.draft_tokens)
+
+    plain_tokens = plain_sec = 0
+    mismatches = 0
+    for prompt in PROMPTS:
+        messages = [
+            {"role": "system", "content": DEFAULT_SYSTEM_PROMPT},
+            {"role": "user", "content": prompt},
+        ]
+        input_ids = tokenizer.apply_chat_template(
+            messages, add_generation_prompt=True, return_tensors="pt"
+        ).to(model.device)
+
+        t_start = time.perf_counter()
+        output = model.generate(input_ids=input_ids, max_new_tokens=args.max_new_tokens, do_sample=False)
+        plain_sec += time.perf_counter() - t_start
+        plain = [t for t in output[0, input_ids.shape[1]:].tolist() if t not in assisted.eos_token_ids]
+        plain_tokens += len(plain)
+
+        fast = assisted.generate(input_ids, args.max_new_tokens)
+        mismatches += fast != plain
+
+    stats = assisted.stats()
+    print(f"Plain greedy:     {plain_tokens / plain_sec:.2f} tokens/s")
+    print(f"Assisted:         {stats['effective_tokens_per_sec']:.2f} tokens/s")
+    print(f"Acceptance rate:  {stats['acceptance_rate']:.2%} ({stats['tokens_per_round']} tokens/round)")
+    print(f"Output mismatches: {mismatches}/{len(PROMPTS)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+# llm_service/bench_prefix_cache.py
+"""
+Benchmark: generation with vs. without the precomputed system-prompt KV-cache.
+
+    python bench_prefix_cache.py [--runs 3] [--max-new-tokens 100]
+
+Reports prefill latency (time to the first new token) and full-turn latency
+for both paths, and checks that greedy outputs agree.
+"""
+
+import argparse
+import time
+
+from prompts import DEFAULT_SYSTEM_PROMPT
+from generation import ChatGenerator
+from llm_loader import load_model
+
+PROMPTS = [
+    "Hello, who are you?",
+    "What do you think about jellyfishing?",
+    "Can you recommend a good book?",
+    "Why are you always so grumpy?",
+]
+
+
+def time_turn(generator, messages, max_new_tokens):
+    t_start = time.perf_counter()
+    reply = generator.generate(messages, max_new_tokens=max_new_tokens, do_sample=False)
+    return time.perf_counter() - t_start, reply
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--max-new-tokens", type=int, default=100)
+    args = parser.parse_args()
+
+    pipe = load_model()
+    cached = ChatGenerator(pipe.model, pipe.tokenizer, use_prefix_cache=True)
+    plain = ChatGenerator(pipe.model, pipe.tokenizer, use_prefix_cache=False)
+    cached.warm_up(DEFAULT_SYSTEM_PROMPT)
+    print(f"System prompt length: {cached.prefix_cache.prefix_length()} tokens")
+
+    totals = {"plain": [0.0, 0.0], "cached": [0.0, 0.0]}
+    mismatches = 0
+    for prompt in PROMPTS:
+        messages = [
+            {"role": "system", "content": DEFAULT_SYSTEM_PROMPT},
+            {"role": "user", "content": prompt},
+        ]
+        for _ in range(args.runs):
+            for name, gen in (("plain", plain), ("cached", cached)):
+                totals[name][0] += time_turn(gen, messages, 1)[0]
+            t_plain, reply_plain = time_turn(plain, messages, args.max_new_tokens)
+            t_cached, reply_cached = time_turn(cached, messages, args.max_new_tokens)
+            totals["plain"][1] += t_plain
+            totals["cached"][1] += t_cached
+            mismatches += reply_plain != reply_cached
+
+    n = len(PROMPTS) * args.runs
+    print(f"{'path':<8}{'prefill (s)':>14}{'turn (s)':>12}")
+    for name, (prefill, turn) in totals.items():
+        print(f"{name:<8}{prefill / n:>14.3f}{turn / n:>12.3f}")
+
+    saved = (totals["plain"][0] - totals["cached"][0]) / n
+    print(f"Prefill saved per turn: {saved:.3f} s")
+    print(f"Greedy output mismatches: {mismatches}/{n}")
+
+
+if __name__ == "__main__":
+    main()
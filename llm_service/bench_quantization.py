@@ -0,0 +1,134 @@
+# llm_service/bench_quantization.py
+"""
+Benchmark: baseline ("auto") vs. int8 dynamically quantized Phi-4 on CPU.
+
+    python bench_quantization.py [--modes auto int8] [--max-new-tokens 64]
+
+Every mode is loaded in its own subprocess (LLM_LOAD_MODE=<mode>) so peak RSS
+is measured in isolation. Reports load time, tokens/sec and peak RSS, and the
+agreement of each mode's greedy outputs with the first (baseline) mode.
+On Windows peak RSS needs psutil; without it the column shows n/a.
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+PROMPTS = [
+    "Hello, who are you?",
+    "What do you think about jellyfishing?",
+    "Can you recommend a good book?",
+    "Tell me about your clarinet.",
+    "Why are you always so grumpy?",
+    "What is your favourite painting?",
+]
+
+
+def run_worker(max_new_tokens, out_path):
+    t_load = time.perf_counter()
+    from llm_loader import load_model, warm_up, LOAD_MODE
+    pipe = load_model()
+    load_sec = time.perf_counter() - t_load
+    warm_up(pipe)
+
+    model, tokenizer = pipe.model, pipe.tokenizer
+    outputs, n_tokens, gen_sec = [], 0, 0.0
+    for prompt in PROMPTS:
+        input_ids = tokenizer.apply_chat_template(
+            [{"role": "user", "content": prompt}], add_generation_prompt=True, return_tensors="pt"
+        ).to(model.device)
+        t_start = time.perf_counter()
+        output = model.generate(input_ids=input_ids, max_new_tokens=max_new_tokens, do_sample=False)
+        gen_sec += time.perf_counter() - t_start
+        new_tokens = output[0, input_ids.shape[1]:].tolist()
+        n_tokens += len(new_tokens)
+        outputs.append(new_tokens)
+
+    with open(out_path, "w") as f:
+        json.dump({
+            "mode": LOAD_MODE,
+            "load_sec": load_sec,
+            "tokens_per_sec": n_tokens / gen_sec,
+            "peak_rss_mb": peak_rss_mb(),
+            "outputs": outputs,
+        }, f)
+
+
+def peak_rss_mb():
+    """
+    Peak resident memory of this process in MB, or None if it cannot be measured.
+    """
+    if resource is not None:
+        # ru_maxrss 在 Linux 下单位为 KB，macOS 下为字节
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+    try:
+        import psutil
+    except ImportError:
+        return None
+    # Windows：峰值工作集
+    return psutil.Process().memory_info().peak_wset / (1024 * 1024)
+
+
+def agreement(reference, outputs):
+    """
+    (exact-match rate, mean fraction of tokens matching before the first divergence)
+    """
+    exact, prefix = 0, 0.0
+    for ref, out in zip(reference, outputs):
+        exact += ref == out
+        n = 0
+        for a, b in zip(ref, out):
+            if a != b:
+                break
+            n += 1
+        prefix += n / max(len(ref), 1)
+    return exact / len(reference), prefix / len(reference)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--modes", nargs="+", default=["auto", "int8"])
+    parser.add_argument("--max-new-tokens", type=int, default=64)
+    parser.add_argument("--worker-out", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker_out:
+        run_worker(args.max_new_tokens, args.worker_out)
+        return
+
+    results = []
+    for mode in args.modes:
+        with tempfile.NamedTemporaryFile(suffix=".json", delete=False) as tmp:
+            out_path = tmp.name
+        subprocess.run(
+            [sys.executable, os.path.abspath(__file__),
+             "--max-new-tokens", str(args.max_new_tokens), "--worker-out", out_path],
+            env={**os.environ, "LLM_LOAD_MODE": mode},
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            check=True,
+        )
+        with open(out_path) as f:
+            results.append(json.load(f))
+        os.remove(out_path)
+
+    reference = results[0]["outputs"]
+    print(f"{'mode':<8}{'load (s)':>10}{'tok/s':>10}{'peak RSS (MB)':>16}{'exact':>8}{'prefix':>8}")
+    for r in results:
+        exact, prefix = agreement(reference, r["outputs"])
+        rss = "n/a" if r["peak_rss_mb"] is None else f"{r['peak_rss_mb']:.0f}"
+        print(f"{r['mode']:<8}{r['load_sec']:>10.1f}{r['tokens_per_sec']:>10.2f}"
+              f"{rss:>16}{exact:>8.2f}{prefix:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+# llm_service/generation.py
+
+"""
+Chat generation on top of the loaded pipeline's model and tokenizer.
+
+Replaces the plain `pipe(messages, ...)` call so that every turn can start
+from the precomputed system-prompt KV-cache (see prefix_cache.py).
+"""
+
+import torch
+
+from prefix_cache import PrefixCache
+
+
+class ChatGenerator:
+    def __init__(self, model, tokenizer, use_prefix_cache=True):
+        self.model = model
+        self.tokenizer = tokenizer
+        self.prefix_cache = PrefixCache(model, tokenizer) if use_prefix_cache else None
+        self.pad_token_id = (tokenizer.pad_token_id if tokenizer.pad_token_id is not None
+                             else tokenizer.eos_token_id)
+
+    def warm_up(self, system_prompt):
+        """
+        Prefill the system prompt ahead of the first request.
+        """
+        if self.prefix_cache is not None:
+            self.prefix_cache.prepare([{"role": "system", "content": system_prompt},
+                                       {"role": "user", "content": "Hi"}])
+
+    @torch.no_grad()
+    def generate(self, messages, streamer=None, **generation_args):
+        """
+        Generate a reply for a chat; returns the decoded new text.
+        :param generation_args: forwarded to model.generate (max_new_tokens, temperature, ...)
+        """
+        if self.prefix_cache is not None:
+            input_ids, past_key_values = self.prefix_cache.prepare(messages)
+        else:
+            input_ids = self.tokenizer.apply_chat_template(
+                messages, add_generation_prompt=True, return_tensors="pt"
+            ).to(self.model.device)
+            past_key_values = None
+
+        output = self.model.generate(
+            input_ids=input_ids,
+            attention_mask=torch.ones_like(input_ids),
+            past_key_values=past_key_values,
+            streamer=streamer,
+            pad_token_id=self.pad_token_id,
+            **generation_args,
+        )
+        return self.tokenizer.decode(output[0, input_ids.shape[1]:], skip_special_tokens=True)
@@ -0,0 +1,81 @@
+# llm_service/prefix_cache.py
+
+"""
+Precomputed KV-cache for the fixed system prompt.
+
+The system prompt is identical for every turn, so its key/values are computed
+once (prefill) and kept. Each generation starts from a deep copy of that
+cache and only has to prefill the conversation turns that follow it. The
+cache is keyed by a hash of the prompt text, so a changed prompt is detected
+and re-prefilled automatically.
+"""
+
+import copy
+import hashlib
+import threading
+import time
+
+import torch
+from transformers import DynamicCache
+
+
+class PrefixCache:
+    def __init__(self, model, tokenizer):
+        self.model = model
+        self.tokenizer = tokenizer
+        self._lock = threading.Lock()
+        self._key = None
+        self._prefix_ids = None
+        self._cache = None
+
+        self.hits = 0
+        self.misses = 0
+
+    def prepare(self, messages):
+        """
+        Tokenize a chat and return (input_ids, past_key_values).
+        past_key_values is a private copy of the system-prompt cache, or None if
+        the chat does not start with a cacheable prefix.
+        """
+        input_ids = self.tokenizer.apply_chat_template(
+            messages, add_generation_prompt=True, return_tensors="pt"
+        ).to(self.model.device)
+
+        if not messages or messages[0]["role"] != "system":
+            self.misses += 1
+            return input_ids, None
+
+        prefix_ids, cache = self._get(messages[0]["content"])
+        n = prefix_ids.shape[1]
+        # 只有在完整输入的开头与前缀 token 完全一致时才能复用
+        if input_ids.shape[1] <= n or not torch.equal(input_ids[0, :n], prefix_ids[0]):
+            self.misses += 1
+            return input_ids, None
+
+        self.hits += 1
+        return input_ids, copy.deepcopy(cache)
+
+    def prefix_length(self):
+        return 0 if self._prefix_ids is None else self._prefix_ids.shape[1]
+
+    def _get(self, system_prompt):
+        key = hashlib.sha256(system_prompt.encode()).hexdigest()
+        with self._lock:
+            if key != self._key:
+                self._prefill(system_prompt)
+                self._key = key
+            return self._prefix_ids, self._cache
+
+    @torch.no_grad()
+    def _prefill(self, system_prompt):
+        t_start = time.time()
+        prefix_ids = self.tokenizer.apply_chat_template(
+            [{"role": "system", "content": system_prompt}], return_tensors="pt"
+        ).to(self.model.device)
+
+        cache = DynamicCache()
+        self.model(input_ids=prefix_ids, past_key_values=cache, use_cache=True)
+
+        self._prefix_ids = prefix_ids
+        self._cache = cache
+        print(f"System prompt prefilled: {prefix_ids.shape[1]} tokens in {time.time() - t_start:.3f} seconds.")
@@ -0,0 +1,118 @@
+# llm_service/response_cache.py
+
+"""
+Response cache for short, repeated utterances.
+
+Keys combine the normalized user text ("Hello!" == "hello"), a fingerprint of
+the conversation context the reply depends on (system prompt plus the last
+few history messages) and the generation arguments. Only deterministic-ish
+settings are cached: requests whose temperature is above `max_temperature`
+(with sampling on) always go to the model. Bounded LRU with a TTL.
+"""
+
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+ENABLED = os.environ.get("LLM_CACHE_ENABLED", "1") == "1"
+MAX_ENTRIES = int(os.environ.get("LLM_CACHE_MAX_ENTRIES", 512))
+TTL_SEC = float(os.environ.get("LLM_CACHE_TTL_SEC", 3600))
+MAX_TEMPERATURE = float(os.environ.get("LLM_CACHE_MAX_TEMPERATURE", 0.3))
+# 参与指纹计算的最近历史消息条数
+CONTEXT_MESSAGES = int(os.environ.get("LLM_CACHE_CONTEXT_MESSAGES", 2))
+
+_NON_WORD = re.compile(r"[^\w\s]")
+_SPACES = re.compile(r"\s+")
+
+
+def normalize(text: str) -> str:
+    text = _NON_WORD.sub("", text.lower())
+    return _SPACES.sub(" ", text).strip()
+
+
+class ResponseCache:
+    def __init__(self, enabled=ENABLED, max_entries=MAX_ENTRIES, ttl_sec=TTL_SEC,
+                 max_temperature=MAX_TEMPERATURE, context_messages=CONTEXT_MESSAGES):
+        self.enabled = enabled
+        self.max_entries = max_entries
+        self.ttl_sec = ttl_sec
+        self.max_temperature = max_temperature
+        self.context_messages = context_messages
+
+        self._data = OrderedDict()  # key -> (created_at, reply)
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.bypassed = 0
+        self.evictions = 0
+
+    def cacheable(self, generation_args, default_do_sample=False):
+        if not self.enabled:
+            return False
+        do_sample = generation_args.get("do_sample", default_do_sample)
+        if do_sample and generation_args.get("temperature", 1.0) > self.max_temperature:
+            self.bypassed += 1
+            return False
+        return True
+
+    def make_key(self, messages, generation_args):
+        """
+        :param messages: full chat as sent to the model (system, history..., user)
+        """
+        system = [m["content"] for m in messages[:1] if m["role"] == "system"]
+        history = messages[len(system):-1]
+        context = history[-self.context_messages:] if self.context_messages else []
+
+        h = hashlib.sha256()
+        h.update(normalize(messages[-1]["content"]).encode())
+        h.update(json.dumps([system, context], ensure_ascii=False).encode())
+        h.update(json.dumps(generation_args, sort_keys=True).encode())
+        return h.hexdigest()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and time.time() - entry[0] > self.ttl_sec:
+                del self._data[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, reply):
+        with self._lock:
+            self._data[key] = (time.time(), reply)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def flush(self):
+        with self._lock:
+            n = len(self._data)
+            self._data.clear()
+        return n
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "enabled": self.enabled,
+                "entries": len(self._data),
+                "max_entries": self.max_entries,
+                "ttl_sec": self.ttl_sec,
+                "max_temperature": self.max_temperature,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "bypassed": self.bypassed,
+                "evictions": self.evictions,
+            }
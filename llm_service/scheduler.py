@@ -0,0 +1,370 @@
+# llm_service/scheduler.py
+
+"""
+Continuous batching for concurrent LLM requests.
+
+A single worker thread owns the model and runs one generation loop:
+
+- at every token boundary, waiting requests are admitted (up to
+  `max_batch_size`): their prompt is prefilled on its own, starting from the
+  system-prompt prefix cache when possible, and they join the running batch
+- one batched forward pass then decodes the next token for every active
+  sequence over a shared batch KV-cache, in which each sequence's cache is
+  left-padded to the longest one, with a matching attention mask and explicit
+  position ids so padding never affects the result. The batch cache is only
+  re-packed when sequences join or leave; between those steps the forward
+  pass appends to it in place (a lone sequence is never padded or copied)
+- each sequence is sampled with its own settings and checked against its own
+  stopping conditions (EOS, max_new_tokens, custom criteria); finished ones
+  leave the batch immediately and their caller is resolved
+
+Callers get a Future; token streamers (e.g. TextIteratorStreamer) are fed the
+same way `model.generate` feeds them. The waiting queue is bounded: `submit`
+raises QueueFull (with a Retry-After estimate) instead of queueing without
+limit, and requests whose stopping criteria report `cancelled` (deadline
+passed, client gone) are dropped before prefill.
+"""
+
+import asyncio
+import collections
+import math
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import torch
+import torch.nn.functional as F
+from transformers import DynamicCache
+
+MAX_BATCH_SIZE = int(os.environ.get("LLM_MAX_BATCH_SIZE", 8))
+MAX_QUEUE = int(os.environ.get("LLM_MAX_QUEUE", 32))
+# 统计吞吐量的滑动窗口
+THROUGHPUT_WINDOW_SEC = 10.0
+
+_ALLOWED_ARGS = {"max_new_tokens", "temperature", "do_sample"}
+
+
+class QueueFull(Exception):
+    def __init__(self, retry_after):
+        super().__init__(f"Generation queue is full, retry after {retry_after} s")
+        self.retry_after = retry_after
+
+
+class RequestCancelled(Exception):
+    pass
+
+
+class _Sequence:
+    def __init__(self, input_ids, past_key_values, generation_args, stopping_criteria, streamer, future):
+        self.input_ids = input_ids
+        self.prefix_cache = past_key_values
+        self.max_new_tokens = generation_args["max_new_tokens"]
+        self.temperature = generation_args["temperature"]
+        self.do_sample = generation_args["do_sample"] and self.temperature > 0
+        self.stopping_criteria = stopping_criteria or []
+        self.streamer = streamer
+        self.future = future
+
+        self.past = None  # legacy cache from prefill, [1, H, L, D] per layer; None once in the batch cache
+        self.cache_len = 0
+        self.generated = []
+        self.finish_reason = None
+        self.t_submit = time.time()
+
+
+class ContinuousBatchingScheduler:
+    def __init__(self, model, tokenizer, prefix_cache=None, max_batch_size=MAX_BATCH_SIZE,
+                 max_queue=MAX_QUEUE):
+        self.model = model
+        self.tokenizer = tokenizer
+        self.prefix_cache = prefix_cache
+        self.max_batch_size = max_batch_size
+        self.max_queue = max_queue
+
+        eos = model.generation_config.eos_token_id
+        self.eos_token_ids = set(eos if isinstance(eos, (list, tuple)) else [eos])
+        self.default_do_sample = bool(model.generation_config.do_sample)
+
+        self._waiting = queue.Queue()
+        self._active = []
+        # 补齐后的 batch KV-cache 及其成员（顺序即行号）；成员不变时逐步复用，不再重新拼接
+        self._batch = []
+        self._batch_cache = None
+        self._batch_len = 0
+        self._recent = collections.deque()  # (timestamp, tokens) per decode step
+        self.total_tokens = 0
+        self.total_requests = 0
+        self.rejected = 0
+        self.cancelled = 0
+        self.steps = 0
+        self._avg_latency = 5.0  # 请求耗时的指数滑动平均，用于估算 Retry-After
+
+        self._thread = threading.Thread(target=self._run, name="llm-scheduler", daemon=True)
+        self._thread.start()
+
+    # ---------------- public API ----------------
+
+    def submit(self, messages, streamer=None, stopping_criteria=None, **generation_args) -> Future:
+        """
+        Queue a chat for generation; the Future resolves to the decoded reply.
+        :param stopping_criteria: callables (input_ids, scores) -> bool / BoolTensor, checked every token
+        :param generation_args: max_new_tokens, temperature, do_sample
+        """
+        unknown = set(generation_args) - _ALLOWED_ARGS
+        if unknown:
+            raise TypeError(f"Unsupported generation args: {sorted(unknown)}")
+        if self._waiting.qsize() >= self.max_queue:
+            self.rejected += 1
+            raise QueueFull(self.retry_after())
+        args = {
+            "max_new_tokens": generation_args.get("max_new_tokens", 100),
+            "temperature": float(generation_args.get("temperature", 1.0)),
+            "do_sample": generation_args.get("do_sample", self.default_do_sample),
+        }
+
+        future = Future()
+        self._waiting.put((messages, args, stopping_criteria, streamer, future))
+        return future
+
+    async def generate(self, messages, streamer=None, stopping_criteria=None, **generation_args):
+        future = self.submit(messages, streamer=streamer, stopping_criteria=stopping_criteria,
+                             **generation_args)
+        return await asyncio.wrap_future(future)
+
+    def retry_after(self):
+        """
+        Rough seconds until a queue slot frees up.
+        """
+        waves = 1 + self._waiting.qsize() / self.max_batch_size
+        return max(1, math.ceil(self._avg_latency * waves))
+
+    def stats(self):
+        now = time.time()
+        recent = [n for t, n in list(self._recent) if now - t <= THROUGHPUT_WINDOW_SEC]
+        active = len(self._active)
+        return {
+            "queue_depth": self._waiting.qsize(),
+            "max_queue": self.max_queue,
+            "active_sequences": active,
+            "max_batch_size": self.max_batch_size,
+            "batch_occupancy": round(active / self.max_batch_size, 3),
+            "tokens_per_sec": round(sum(recent) / THROUGHPUT_WINDOW_SEC, 2),
+            "total_tokens": self.total_tokens,
+            "total_requests": self.total_requests,
+            "rejected": self.rejected,
+            "cancelled": self.cancelled,
+            "decode_steps": self.steps,
+        }
+
+    # ---------------- worker loop ----------------
+
+    def _run(self):
+        while True:
+            if not self._active:
+                # 空闲时阻塞等待新请求
+                self._admit(self._waiting.get())
+            while len(self._active) < self.max_batch_size:
+                try:
+                    self._admit(self._waiting.get_nowait())
+                except queue.Empty:
+                    break
+
+            if not self._active:
+                continue
+
+            try:
+                self._decode_step()
+            except Exception as e:
+                print(f"Decode step failed: {e}")
+                for seq in self._active:
+                    self._fail(seq, e)
+                self._active = []
+                self._reset_batch()
+
+    def _admit(self, item):
+        messages, args, stopping_criteria, streamer, future = item
+        if not future.set_running_or_notify_cancel():
+            return
+        # 排队期间已超时或客户端已断开：不再占用算力
+        if any(getattr(c, "cancelled", False) for c in stopping_criteria or []):
+            self.cancelled += 1
+            future.set_exception(RequestCancelled("Request cancelled before generation started"))
+            if streamer is not None:
+                streamer.end()
+            return
+
+        try:
+            if self.prefix_cache is not None:
+                input_ids, past = self.prefix_cache.prepare(messages)
+            else:
+                input_ids = self.tokenizer.apply_chat_template(
+                    messages, add_generation_prompt=True, return_tensors="pt"
+                ).to(self.model.device)
+                past = None
+
+            seq = _Sequence(input_ids, past, args, stopping_criteria, streamer, future)
+            if streamer is not None:
+                streamer.put(input_ids.cpu())
+            self._prefill(seq)
+        except Exception as e:
+            future.set_exception(e)
+            if streamer is not None:
+                streamer.end()
+            return
+
+        self.total_requests += 1
+        self._record(1)
+        if not self._finished(seq):
+            self._active.append(seq)
+
+    @torch.no_grad()
+    def _prefill(self, seq):
+        past = seq.prefix_cache if seq.prefix_cache is not None else DynamicCache()
+        cached = past.get_seq_length()
+        new_ids = seq.input_ids[:, cached:]
+        out = self.model(
+            input_ids=new_ids,
+            attention_mask=torch.ones_like(seq.input_ids),
+            past_key_values=past,
+            cache_position=torch.arange(cached, seq.input_ids.shape[1], device=new_ids.device),
+            use_cache=True,
+        )
+        seq.prefix_cache = None
+        seq.past = out.past_key_values.to_legacy_cache()
+        seq.cache_len = seq.input_ids.shape[1]
+        self._append_token(seq, out.logits[0, -1])
+
+    @torch.no_grad()
+    def _decode_step(self):
+        batch = self._active
+        device = self.model.device
+        if self._batch != batch:
+            self._rebuild_batch_cache(batch)
+        max_len = self._batch_len
+
+        attention_mask = torch.zeros(len(batch), max_len + 1, dtype=torch.long, device=device)
+        for i, seq in enumerate(batch):
+            attention_mask[i, max_len - seq.cache_len:] = 1
+
+        out = self.model(
+            input_ids=torch.tensor([[seq.generated[-1]] for seq in batch], device=device),
+            attention_mask=attention_mask,
+            position_ids=torch.tensor([[seq.cache_len] for seq in batch], device=device),
+            past_key_values=self._batch_cache,
+            cache_position=torch.tensor([max_len], device=device),
+            use_cache=True,
+        )
+
+        # 新 token 的 KV 已追加到 batch cache 中，各序列的左侧补齐量保持不变
+        self._batch_cache = out.past_key_values
+        self._batch_len += 1
+        for i, seq in enumerate(batch):
+            seq.cache_len += 1
+            self._append_token(seq, out.logits[i, -1])
+
+        self.steps += 1
+        self._record(len(batch))
+        self._active = [seq for seq in batch if not self._finished(seq)]
+        if not self._active:
+            self._reset_batch()
+
+    def _rebuild_batch_cache(self, batch):
+        """
+        Re-pack the batch KV-cache after sequences joined or left. Each
+        sequence's cache (sliced out of the previous batch cache, or fresh from
+        prefill) is left-padded to the longest one.
+        """
+        caches = []
+        old = self._batch_cache.to_legacy_cache() if self._batch_cache is not None else None
+        for seq in batch:
+            if seq.past is None:
+                # 上一轮 batch 中的序列：去掉左侧补齐部分取出自己的 cache
+                i = self._batch.index(seq)
+                start = self._batch_len - seq.cache_len
+                seq.past = tuple((k[i:i + 1, :, start:], v[i:i + 1, :, start:]) for k, v in old)
+            caches.append(seq.past)
+
+        max_len = max(seq.cache_len for seq in batch)
+        if len(batch) == 1:
+            # 单序列无需补齐，也不做拼接拷贝
+            legacy = caches[0]
+        else:
+            legacy = []
+            for layer in range(len(caches[0])):
+                keys, values = [], []
+                for seq, past in zip(batch, caches):
+                    pad = max_len - seq.cache_len
+                    k, v = past[layer]
+                    keys.append(F.pad(k, (0, 0, pad, 0)) if pad else k)
+                    values.append(F.pad(v, (0, 0, pad, 0)) if pad else v)
+                legacy.append((torch.cat(keys), torch.cat(values)))
+
+        # 之后序列的 KV 只保存在 batch cache 中
+        for seq in batch:
+            seq.past = None
+        self._batch = list(batch)
+        self._batch_cache = DynamicCache.from_legacy_cache(tuple(legacy))
+        self._batch_len = max_len
+
+    def _reset_batch(self):
+        self._batch = []
+        self._batch_cache = None
+        self._batch_len = 0
+
+    # ---------------- per-sequence helpers ----------------
+
+    def _append_token(self, seq, logits):
+        if seq.do_sample:
+            probs = torch.softmax(logits.float() / seq.temperature, dim=-1)
+            token = int(torch.multinomial(probs, 1))
+        else:
+            token = int(torch.argmax(logits))
+        seq.generated.append(token)
+        if seq.streamer is not None and token not in self.eos_token_ids:
+            seq.streamer.put(torch.tensor([token]))
+
+    def _finished(self, seq):
+        token = seq.generated[-1]
+        if token in self.eos_token_ids:
+            seq.finish_reason = "eos"
+        elif len(seq.generated) >= seq.max_new_tokens:
+            seq.finish_reason = "length"
+        elif seq.stopping_criteria and self._criteria_met(seq):
+            seq.finish_reason = "stop"
+        else:
+            return False
+
+        if any(getattr(c, "cancelled", False) for c in seq.stopping_criteria):
+            self.cancelled += 1
+        self._avg_latency = 0.9 * self._avg_latency + 0.1 * (time.time() - seq.t_submit)
+
+        tokens = [t for t in seq.generated if t not in self.eos_token_ids]
+        seq.past = None
+        if seq.streamer is not None:
+            seq.streamer.end()
+        seq.future.set_result(self.tokenizer.decode(tokens, skip_special_tokens=True))
+        return True
+
+    def _criteria_met(self, seq):
+        ids = torch.cat([seq.input_ids.cpu(), torch.tensor([seq.generated])], dim=-1)
+        for criterion in seq.stopping_criteria:
+            result = criterion(ids, None)
+            if bool(result.all()) if torch.is_tensor(result) else bool(result):
+                return True
+        return False
+
+    def _fail(self, seq, error):
+        seq.past = None
+        if seq.streamer is not None:
+            seq.streamer.end()
+        if not seq.future.done():
+            seq.future.set_exception(error)
+
+    def _record(self, n_tokens):
+        now = time.time()
+        self.total_tokens += n_tokens
+        self._recent.append((now, n_tokens))
+        while self._recent and now - self._recent[0][0] > THROUGHPUT_WINDOW_SEC:
+            self._recent.popleft()
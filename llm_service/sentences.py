@@ -0,0 +1,116 @@
+# llm_service/sentences.py
+
+"""
+Incremental, abbreviation-aware sentence segmentation.
+
+Text is fed in as it is decoded; `feed` returns the sentences that are now
+known to be complete. A Latin full stop only ends a sentence once the next
+character is whitespace and the word before it is not an abbreviation or an
+initial ("Dr. Smith", "e.g. this", "J. R. R."), so a boundary is never
+reported early. CJK sentence punctuation ends a sentence immediately.
+"""
+
+import re
+
+# 不收录本身就是普通单词的缩写（"co." "mar." "dec." "sep." "fig."），否则会吞掉真实句末
+ABBREVIATIONS = {
+    "mr", "mrs", "ms", "dr", "prof", "sr", "jr", "st", "mt", "vs", "etc",
+    "e.g", "i.e", "cf", "a.m", "p.m", "u.s", "u.k", "inc", "ltd", "corp",
+    "dept", "approx", "jan", "feb", "apr", "jun", "jul", "aug", "sept",
+    "oct", "nov",
+}
+# 只有后面跟数字时才是缩写（"No. 5"）；单独的 "No." 往往就是一整句
+NUMERAL_ABBREVIATIONS = {"no"}
+
+_CLOSERS = "\"'”’)]」』）"
+_LATIN_END = re.compile(r"[.!?…]+[" + re.escape(_CLOSERS) + r"]*(?=\s)")
+_CJK_END = re.compile(r"[。！？]+[" + re.escape(_CLOSERS) + r"]*")
+_LAST_WORD = re.compile(r"(\S+)$")
+_TRAILING_END = re.compile(r"([.!?…。！？]+)[" + re.escape(_CLOSERS) + r"]*$")
+
+
+def is_abbreviation(text_before_dot: str, text_after_dot: str = "") -> bool:
+    match = _LAST_WORD.search(text_before_dot)
+    if not match:
+        return False
+    word = match.group(1).lstrip("(\"'“‘").lower()
+    # 单个字母的缩写/首字母，如 "J." "U.S."
+    if len(word) == 1 and word.isalpha():
+        return True
+    if word in NUMERAL_ABBREVIATIONS:
+        # 后文尚未出现时按缩写处理，不提前报告句末
+        following = text_after_dot.lstrip()
+        return not following or following[0].isdigit()
+    return word in ABBREVIATIONS
+
+
+def find_boundaries(text: str):
+    """
+    End offsets of complete sentences in text (boundary after the punctuation).
+    """
+    ends = []
+    for m in _LATIN_END.finditer(text):
+        if m.group(0).rstrip(_CLOSERS) == "." and is_abbreviation(text[:m.start()], text[m.end():]):
+            continue
+        ends.append(m.end())
+    for m in _CJK_END.finditer(text):
+        ends.append(m.end())
+    return sorted(set(ends))
+
+
+def split_sentences(text: str):
+    """
+    Split a complete text into sentences.
+    """
+    splitter = SentenceSplitter()
+    sentences = splitter.feed(text)
+    tail = splitter.flush()
+    return sentences + ([tail] if tail else [])
+
+
+class SentenceSplitter:
+    def __init__(self):
+        self.buffer = ""
+        self.count = 0
+
+    def feed(self, text: str):
+        """
+        Add newly decoded text; return the sentences completed by it.
+        """
+        self.buffer += text
+        sentences = []
+        start = 0
+        for end in find_boundaries(self.buffer):
+            sentence = self.buffer[start:end].strip()
+            if sentence:
+                sentences.append(sentence)
+            start = end
+        self.buffer = self.buffer[start:]
+        self.count += len(sentences)
+        return sentences
+
+    def ends_with_boundary(self):
+        """
+        Whether the pending text already ends like a finished sentence
+        ("... fine." / "... really?"), before the following whitespace arrives.
+        A full stop after a digit or an abbreviation does not count.
+        """
+        text = self.buffer.rstrip()
+        m = _TRAILING_END.search(text)
+        if not m or not text[:m.start()].strip():
+            return False
+        if m.group(1) == ".":
+            before = text[:m.start()]
+            if before[-1:].isdigit() or is_abbreviation(before):
+                return False
+        return True
+
+    def flush(self):
+        """
+        Return whatever is left once generation has finished.
+        """
+        tail = self.buffer.strip()
+        self.buffer = ""
+        if tail:
+            self.count += 1
+        return tail
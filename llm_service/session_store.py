@@ -0,0 +1,153 @@
+# llm_service/session_store.py
+
+"""
+Per-session conversation store.
+
+Every session keeps its own user/assistant turns. Before each generation the
+history is cut to a token budget (counted with the loaded tokenizer), dropping
+the oldest turns first, so prompt length - and therefore per-turn latency -
+stays flat however long the service runs. Sessions idle for longer than
+`idle_ttl_sec` are evicted from memory; with `persist_dir` set they are kept
+as one JSON file per session and transparently reloaded on the next request.
+"""
+
+import json
+import os
+import re
+import threading
+import time
+import uuid
+
+MAX_HISTORY_TOKENS = int(os.environ.get("LLM_HISTORY_TOKENS", 1024))
+IDLE_TTL_SEC = float(os.environ.get("LLM_SESSION_TTL_SEC", 1800))
+# 为空则只保存在内存中
+PERSIST_DIR = os.environ.get("LLM_SESSION_DIR", "")
+
+# chat template 中每条消息的角色标记等额外开销（近似值）
+MESSAGE_OVERHEAD_TOKENS = 4
+EVICT_INTERVAL_SEC = 60
+
+_SESSION_ID_RE = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+
+class Session:
+    __slots__ = ("messages", "token_counts", "last_access")
+
+    def __init__(self, messages=None, token_counts=None):
+        self.messages = messages or []
+        self.token_counts = token_counts or []
+        self.last_access = time.time()
+
+
+class SessionStore:
+    def __init__(self, system_prompt, tokenizer, max_history_tokens=MAX_HISTORY_TOKENS,
+                 idle_ttl_sec=IDLE_TTL_SEC, persist_dir=PERSIST_DIR):
+        self.system_prompt = system_prompt
+        self.tokenizer = tokenizer
+        self.max_history_tokens = max_history_tokens
+        self.idle_ttl_sec = idle_ttl_sec
+        self.persist_dir = persist_dir or None
+
+        self._sessions = {}
+        self._lock = threading.Lock()
+        self._last_evict = time.time()
+
+        if self.persist_dir:
+            os.makedirs(self.persist_dir, exist_ok=True)
+
+    @staticmethod
+    def validate_id(session_id):
+        if session_id is None:
+            return uuid.uuid4().hex
+        if not _SESSION_ID_RE.match(session_id):
+            raise ValueError("session_id must be 1-64 characters of [A-Za-z0-9_-]")
+        return session_id
+
+    def build_messages(self, session_id, user_message):
+        """
+        System prompt + history (within the token budget) + the new user turn.
+        """
+        with self._lock:
+            session = self._get(session_id)
+            history = list(session.messages)
+        return [{"role": "system", "content": self.system_prompt}] + history + \
+            [{"role": "user", "content": user_message}]
+
+    def append_turn(self, session_id, user_message, reply):
+        with self._lock:
+            session = self._get(session_id)
+            for role, content in (("user", user_message), ("assistant", reply)):
+                session.messages.append({"role": role, "content": content})
+                session.token_counts.append(self._count_tokens(content))
+            self._trim(session)
+            self._save(session_id, session)
+        self.evict_idle()
+
+    def delete(self, session_id):
+        with self._lock:
+            self._sessions.pop(session_id, None)
+            if self.persist_dir:
+                try:
+                    os.remove(self._path(session_id))
+                except FileNotFoundError:
+                    pass
+
+    def evict_idle(self, force=False):
+        now = time.time()
+        if not force and now - self._last_evict < EVICT_INTERVAL_SEC:
+            return
+        with self._lock:
+            self._last_evict = now
+            idle = [sid for sid, s in self._sessions.items() if now - s.last_access > self.idle_ttl_sec]
+            for sid in idle:
+                del self._sessions[sid]
+        if idle:
+            print(f"Evicted {len(idle)} idle session(s)")
+
+    def stats(self):
+        with self._lock:
+            return {
+                "active_sessions": len(self._sessions),
+                "max_history_tokens": self.max_history_tokens,
+                "idle_ttl_sec": self.idle_ttl_sec,
+                "persist_dir": self.persist_dir,
+            }
+
+    # ---------------- internals (caller holds the lock) ----------------
+
+    def _get(self, session_id):
+        session = self._sessions.get(session_id)
+        if session is None:
+            session = self._load(session_id) or Session()
+            self._sessions[session_id] = session
+        session.last_access = time.time()
+        return session
+
+    def _trim(self, session):
+        # 从最早的一轮开始丢弃（成对丢弃 user/assistant），直到不超过预算
+        while session.messages and sum(session.token_counts) > self.max_history_tokens:
+            drop = 2 if len(session.messages) >= 2 else 1
+            del session.messages[:drop]
+            del session.token_counts[:drop]
+
+    def _count_tokens(self, text):
+        return len(self.tokenizer.encode(text, add_special_tokens=False)) + MESSAGE_OVERHEAD_TOKENS
+
+    def _path(self, session_id):
+        return os.path.join(self.persist_dir, f"{session_id}.json")
+
+    def _save(self, session_id, session):
+        if not self.persist_dir:
+            return
+        tmp_path = self._path(session_id) + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"messages": session.messages, "token_counts": session.token_counts},
+                      f, ensure_ascii=False)
+        os.replace(tmp_path, self._path(session_id))
+
+    def _load(self, session_id):
+        if not self.persist_dir or not os.path.exists(self._path(session_id)):
+            return None
+        with open(self._path(session_id), "r", encoding="utf-8") as f:
+            data = json.load(f)
+        return Session(data["messages"], data["token_counts"])
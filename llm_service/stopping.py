@@ -0,0 +1,89 @@
+# llm_service/stopping.py
+
+"""
+Stopping criteria shared by the scheduler and `model.generate`.
+
+They follow the transformers StoppingCriteria interface, so the same object
+can be handed to either generation path.
+"""
+
+import threading
+import time
+
+import torch
+from transformers import StoppingCriteria
+
+from sentences import SentenceSplitter
+
+
+class CancellationCriteria(StoppingCriteria):
+    """
+    Stops generation cooperatively once the request is cancelled (client gone)
+    or its deadline has passed.
+    """
+
+    def __init__(self, deadline=None):
+        self.deadline = deadline
+        self._event = threading.Event()
+
+    def cancel(self):
+        self._event.set()
+
+    @property
+    def expired(self):
+        return self.deadline is not None and time.time() >= self.deadline
+
+    @property
+    def cancelled(self):
+        return self._event.is_set() or self.expired
+
+    def __call__(self, input_ids, scores, **kwargs):
+        return torch.full((input_ids.shape[0],), self.cancelled, dtype=torch.bool, device=input_ids.device)
+
+
+class SentenceCountCriteria(StoppingCriteria):
+    """
+    Stops as soon as `max_sentences` complete sentences have been generated.
+
+    New tokens are decoded incrementally and fed to the abbreviation-aware
+    SentenceSplitter. The prompt length is taken from the first call, when
+    exactly one new token has been appended (true for both `model.generate`
+    and the scheduler).
+    """
+
+    def __init__(self, tokenizer, max_sentences, max_new_tokens):
+        self.tokenizer = tokenizer
+        self.max_sentences = max_sentences
+        self.max_new_tokens = max_new_tokens
+
+        self.splitter = SentenceSplitter()
+        self._prompt_length = None
+        self._text = ""
+        self.generated_tokens = 0
+        self.triggered = False
+
+    @property
+    def tokens_saved(self):
+        return self.max_new_tokens - self.generated_tokens if self.triggered else 0
+
+    def __call__(self, input_ids, scores, **kwargs):
+        if self._prompt_length is None:
+            self._prompt_length = input_ids.shape[1] - 1
+        self.generated_tokens = input_ids.shape[1] - self._prompt_length
+
+        if not self.triggered:
+            text = self.tokenizer.decode(input_ids[0, self._prompt_length:], skip_special_tokens=True)
+            if text.startswith(self._text):
+                self.splitter.feed(text[len(self._text):])
+            else:
+                # 多字节字符未解码完整时前缀可能变化，此时整体重新分句
+                self.splitter = SentenceSplitter()
+                self.splitter.feed(text)
+            self._text = text
+
+            done = self.splitter.count
+            if done + 1 == self.max_sentences and self.splitter.ends_with_boundary():
+                done += 1
+            self.triggered = done >= self.max_sentences
+
+        return torch.full((input_ids.shape[0],), self.triggered, dtype=torch.bool, device=input_ids.device)
@@ -4,20 +4,45 @@ torch==2.5.1
 transformers==4.49.0
 """
 
+import gc
+import os
+import time
 import torch
 from transformers import AutoModelForCausalLM, AutoTokenizer, pipeline
 
 MODEL_PATH = "microsoft/Phi-4-mini-instruct"
 
-def load_model():
-    print("Loading model...")
+# 加载模式：auto = 原始精度；int8 = CPU 上对 Linear 层做 int8 动态量化
+LOAD_MODES = ("auto", "int8")
+LOAD_MODE = os.environ.get("LLM_LOAD_MODE", "auto")
 
-    model = AutoModelForCausalLM.from_pretrained(
-        MODEL_PATH,
-        device_map="auto",
-        torch_dtype="auto",
-        trust_remote_code=True,
-    )
+def load_model(mode=LOAD_MODE):
+    if mode not in LOAD_MODES:
+        raise ValueError(f"Unknown load mode {mode!r}, expected one of {LOAD_MODES}")
+
+    print(f"Loading model (mode={mode})...")
+
+    if mode == "int8":
+        # 动态量化只支持 CPU 上的 float32 模型
+        model = AutoModelForCausalLM.from_pretrained(
+            MODEL_PATH,
+            device_map="cpu",
+            torch_dtype=torch.float32,
+            trust_remote_code=True,
+        )
+        # 原地替换 Linear 层（默认 inplace=False 会 deepcopy 整个 fp32 模型，峰值内存翻倍），
+        # 随后回收被替换下来的 fp32 权重，再做预热
+        model = torch.ao.quantization.quantize_dynamic(
+            model, {torch.nn.Linear}, dtype=torch.qint8, inplace=True
+        )
+        gc.collect()
+    else:
+        model = AutoModelForCausalLM.from_pretrained(
+            MODEL_PATH,
+            device_map="auto",
+            torch_dtype="auto",
+            trust_remote_code=True,
+        )
 
     tokenizer = AutoTokenizer.from_pretrained(MODEL_PATH)
 
@@ -27,7 +52,19 @@ def load_model():
         tokenizer=tokenizer,
     )
 
+    if mode == "int8":
+        warm_up(pipe)
+
     return pipe
 
+
+def warm_up(pipe):
+    """
+    Run one short generation so the first real request does not pay for kernel setup.
+    """
+    t_start = time.time()
+    pipe([{"role": "user", "content": "Hello"}], max_new_tokens=8, do_sample=False)
+    print(f"Warm-up finished in {time.time() - t_start:.3f} seconds.")
+
 # 全局只加载一次
 pipe = load_model()
\ No newline at end of file
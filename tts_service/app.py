@@ -1,46 +1,333 @@
 # tts_service/app.py
 
+import asyncio
 import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import torch
-import torchaudio
 import time
-from fastapi import FastAPI, Form
-from fastapi.responses import FileResponse
-from cosy_loader import cosyvoice, prompt_speech_16k
+from typing import Optional
+from fastapi import FastAPI, File, Form, Header, HTTPException, UploadFile
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from audio_cache import AudioCache
+from audio_encode import AudioEncoder, STREAMABLE, media_type, negotiate
+from cosy_loader import call_spk_id, load_cosyvoice, load_default_voice, model_path, DEFAULT_PROMPT_TEXT, DEFAULT_SPK_ID
+from text_split import split_sentences
+from voice_registry import VoiceRegistry
+from wav_utils import stitch
 
-app = FastAPI(title="CosyVoice2 Zero-Shot TTS API (Fixed Voice)")
+app = FastAPI(title="CosyVoice2 Zero-Shot TTS API")
+
+# 模型与音色注册表在后台线程中加载（见 load_models），服务启动后立即响应健康检查；
+# 加载完成前合成/音色接口返回 503
+cosyvoice = None
+voices = None
+
+STARTED_AT = time.time()
+readiness = {"status": "starting", "error": None, "load_sec": None, "warmup_sec": None}
+
+# 报告 ready 前的预热合成（不写入音频缓存）；次数为 0 表示不预热
+WARMUP_RUNS = int(os.environ.get("TTS_WARMUP_RUNS", 1))
+WARMUP_TEXT = os.environ.get("TTS_WARMUP_TEXT", "Hello there.")
+
+# 并发推理线程数。CosyVoice 模型内部状态按请求 uuid 隔离，但 frontend 会把文本写进共享的
+# spk2info 条目，所以每次调用都通过 call_spk_id 使用自己的特征副本
+TTS_WORKERS = int(os.environ.get("TTS_WORKERS", 2))
+tts_executor = ThreadPoolExecutor(max_workers=TTS_WORKERS, thread_name_prefix="tts")
+
+# 多句回复按句并行合成；与 tts_executor 分开，避免请求线程等待自身所在的池
+SENTENCE_WORKERS = int(os.environ.get("TTS_SENTENCE_WORKERS", min(4, os.cpu_count() or 1)))
+sentence_executor = ThreadPoolExecutor(max_workers=SENTENCE_WORKERS, thread_name_prefix="tts-sentence")
+# 句间静音与拼接处淡入淡出长度
+SENTENCE_GAP_MS = float(os.environ.get("TTS_SENTENCE_GAP_MS", 120))
+CROSSFADE_MS = float(os.environ.get("TTS_CROSSFADE_MS", 10))
+
+# 合成结果缓存（内存 LRU + 磁盘），拼接参数也参与缓存 key
+audio_cache = AudioCache()
+CACHE_SETTINGS = {"gap_ms": SENTENCE_GAP_MS, "crossfade_ms": CROSSFADE_MS}
+
+# 输出编码（wav/flac/mp3/ogg-opus）在独立线程池中进行，与合成重叠
+audio_encoder = AudioEncoder()
+
+# CPU intra-op 线程上限；torch.set_num_threads 对整个进程生效，而单句请求（流水线网关的
+# 每次调用）是主要场景，默认不限制。多句回复为主的部署可设为 cpu 核数 // TTS_SENTENCE_WORKERS
+INTRA_OP_THREADS = int(os.environ.get("TTS_INTRA_OP_THREADS", 0))
+if INTRA_OP_THREADS > 0 and not torch.cuda.is_available():
+    torch.set_num_threads(INTRA_OP_THREADS)
+
+
+def load_models():
+    global cosyvoice, voices
+    try:
+        readiness["status"] = "loading"
+        t_start = time.time()
+        cosyvoice = load_cosyvoice()
+        fingerprint = load_default_voice(cosyvoice)
+        # 音色注册表；启动时加载的默认音色常驻内存
+        registry = VoiceRegistry(cosyvoice)
+        registry.add_builtin(DEFAULT_SPK_ID, DEFAULT_PROMPT_TEXT, fingerprint)
+        voices = registry
+        readiness["load_sec"] = round(time.time() - t_start, 3)
+
+        readiness["status"] = "warming_up"
+        t_start = time.time()
+        for _ in range(WARMUP_RUNS):
+            synthesize_voice(WARMUP_TEXT)
+        readiness["warmup_sec"] = round(time.time() - t_start, 3)
+
+        readiness["status"] = "ready"
+        print(f"TTS ready (load {readiness['load_sec']} s, warm-up {readiness['warmup_sec']} s).")
+    except Exception as e:
+        readiness.update(status="failed", error=repr(e))
+        print(f"TTS model loading failed: {e!r}")
+
+
+def _require_ready():
+    if readiness["status"] != "ready":
+        raise HTTPException(status_code=503, detail=f"TTS model not ready ({readiness['status']})",
+                            headers={"Retry-After": "5"})
+
+
+@app.on_event("startup")
+def start_loading():
+    threading.Thread(target=load_models, name="tts-loader", daemon=True).start()
+
+
+@app.get("/health/live")
+async def health_live():
+    # 后台加载失败时进程已无法恢复，报告不存活以便被重启
+    alive = readiness["status"] != "failed"
+    body = {"status": "alive" if alive else "failed", "uptime_sec": round(time.time() - STARTED_AT, 1)}
+    return JSONResponse(body, status_code=200 if alive else 500)
+
+
+@app.get("/health/ready")
+async def health_ready():
+    body = {**readiness, "model": model_path, "uptime_sec": round(time.time() - STARTED_AT, 1)}
+    return JSONResponse(body, status_code=200 if readiness["status"] == "ready" else 503)
+
+
+def synthesize_sentence(text, spk_id=DEFAULT_SPK_ID):
+    """
+    Blocking zero-shot synthesis of one sentence; returns a waveform tensor (1, T).
+    `spk_id` must already be in spk2info (see VoiceRegistry.use).
+    """
+    chunks = []
+    with call_spk_id(cosyvoice, spk_id) as call_id:
+        for out in cosyvoice.inference_zero_shot(
+            text,
+            "",
+            "",
+            zero_shot_spk_id=call_id,
+            stream=False,
+            text_frontend=False
+        ):
+            chunks.append(out["tts_speech"])
+    return torch.cat(chunks, dim=-1)
+
+
+def synthesize(text, spk_id=DEFAULT_SPK_ID):
+    """
+    Split text into sentences, synthesize them concurrently on the sentence
+    pool and stitch the results back in order.
+    """
+    sentences = split_sentences(text) or [text]
+    if len(sentences) == 1:
+        return synthesize_sentence(sentences[0], spk_id)
+    t_start = time.time()
+    segments = list(sentence_executor.map(synthesize_sentence, sentences, [spk_id] * len(sentences)))
+    print(f"Synthesized {len(sentences)} sentences in {time.time() - t_start} seconds.")
+    return stitch(segments, cosyvoice.sample_rate, gap_ms=SENTENCE_GAP_MS, crossfade_ms=CROSSFADE_MS)
+
+
+def cache_key(text, voice_id=DEFAULT_SPK_ID, fmt="wav"):
+    return AudioCache.make_key(text, voices.get(voice_id)["fingerprint"], model_path, {**CACHE_SETTINGS, "format": fmt})
+
+
+def synthesize_voice(text, voice_id=DEFAULT_SPK_ID):
+    with voices.use(voice_id) as spk_id:
+        return synthesize(text, spk_id)
+
+
+def encode_and_store(key, audio, fmt):
+    audio_bytes, saved = audio_encoder.encode(audio, cosyvoice.sample_rate, fmt)
+    audio_cache.put(key, audio_bytes)
+    return audio_bytes, saved
+
+
+def render(text, voice_id=DEFAULT_SPK_ID, fmt="wav"):
+    """
+    Blocking cached synthesis: returns (audio_bytes, cached). Raises KeyError for an unknown voice.
+    """
+    key = cache_key(text, voice_id, fmt)
+    audio_bytes = audio_cache.get(key)
+    if audio_bytes is not None:
+        return audio_bytes, True
+    audio_bytes, _ = encode_and_store(key, synthesize_voice(text, voice_id), fmt)
+    return audio_bytes, False
+
+
+async def render_async(text, voice_id, fmt):
+    """
+    Same as `render`, but synthesis and encoding run on separate pools so a
+    synthesis worker is free for the next request while this one encodes.
+    Returns (audio_bytes, cached, bytes_saved or None for cache hits).
+    """
+    loop = asyncio.get_running_loop()
+    key = cache_key(text, voice_id, fmt)
+    audio_bytes = await loop.run_in_executor(audio_encoder.executor, audio_cache.get, key)
+    if audio_bytes is not None:
+        return audio_bytes, True, None
+    audio = await loop.run_in_executor(tts_executor, synthesize_voice, text, voice_id)
+    audio_bytes, saved = await loop.run_in_executor(audio_encoder.executor, encode_and_store, key, audio, fmt)
+    return audio_bytes, False, saved
+
+
+def _check_voice(voice_id):
+    try:
+        voices.get(voice_id)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Unknown voice_id '{voice_id}'")
+
+
+def _negotiate(format_param, accept, streaming=False):
+    try:
+        fmt = negotiate(format_param, accept)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if streaming and fmt not in STREAMABLE:
+        if format_param:
+            raise HTTPException(status_code=400,
+                                detail=f"Format '{fmt}' cannot be streamed, choose one of {sorted(STREAMABLE)}")
+        fmt = "wav"
+    return fmt
 
-# 默认固定 prompt_text，你也可以换成任何中文或英文
-DEFAULT_PROMPT_TEXT = (
-    "look spongebob i told you use your net and go fish! "
-    "happy birthday, SpongeBob SquarePants! are you insane. "
-    "Hahahaha,Hahahaha,Hahahaha! I'll ever get surrounded by such loser neighbors! "
-    "Hahahaha!Hahahaha!Hahahaha! spongebob, can we lower the volume please?"
-)
 
 @app.post("/tts")
 async def tts_endpoint(
-    text: str = Form(...)
+    text: str = Form(...),
+    voice_id: str = Form(DEFAULT_SPK_ID),
+    format: Optional[str] = Form(None),
+    accept: Optional[str] = Header(None)
 ):
-    # Zero-Shot 推理
+    # Zero-Shot 推理（prompt 特征已在启动时预计算，按 spk_id 复用）
+    # 推理与编码放到线程池，避免阻塞事件循环；命中缓存时直接返回已编码的音频（不写临时文件）
+    # 输出格式：format 参数优先，其次 Accept 头，默认 wav
+    _require_ready()
+    _check_voice(voice_id)
+    fmt = _negotiate(format, accept)
     t_start = time.time()
-    chunks = []
-    for out in cosyvoice.inference_zero_shot(
-        text,
-        DEFAULT_PROMPT_TEXT,
-        prompt_speech_16k,
-        stream=False,
-        text_frontend=False
-    ):
-        chunks.append(out["tts_speech"])
-
-    # 合并 chunk 并输出 wav 文件
-    full_audio = torch.cat(chunks, dim=-1)
-    output_path = "output.wav"
-    torchaudio.save(output_path, full_audio, cosyvoice.sample_rate)
+    audio_bytes, cached, saved = await render_async(text, voice_id, fmt)
 
     t_end = time.time()
 
-    print(f"Finished in {t_end - t_start} seconds.")
+    print(f"Finished in {t_end - t_start} seconds (format={fmt}, cached={cached}).")
+
+    headers = {
+        "Content-Disposition": f'attachment; filename="tts.{fmt}"',
+        "X-Cache": "hit" if cached else "miss",
+    }
+    if saved is not None:
+        headers["X-Audio-Bytes-Saved"] = str(saved)
+    return Response(audio_bytes, media_type=media_type(fmt), headers=headers)
+
+
+@app.get("/tts/cache/stats")
+async def cache_stats():
+    return audio_cache.stats()
+
+
+@app.get("/tts/encoding/stats")
+async def encoding_stats():
+    return audio_encoder.stats()
+
+
+def _stream_chunks(text, voice_id, fmt):
+    """
+    Yields encoded audio for every chunk as soon as CosyVoice produces it
+    (stream=True): a streaming WAV header then 16-bit PCM, or Ogg/Opus pages.
+    Chunk i is encoded on the encoder pool while chunk i + 1 is synthesized.
+    Runs in Starlette's threadpool, so inference does not block the event loop.
+    """
+    t_start = time.time()
+    encoder = audio_encoder.stream(cosyvoice.sample_rate, fmt)
+    pending = None
+    n_chunks = 0
+    with voices.use(voice_id) as spk_id, call_spk_id(cosyvoice, spk_id) as call_id:
+        for out in cosyvoice.inference_zero_shot(
+            text,
+            "",
+            "",
+            zero_shot_spk_id=call_id,
+            stream=True,
+            text_frontend=False
+        ):
+            if pending is not None:
+                yield pending.result()
+            if n_chunks == 0:
+                print(f"First chunk in {time.time() - t_start} seconds.")
+            n_chunks += 1
+            pending = audio_encoder.submit(encoder.feed, out["tts_speech"])
+    if pending is not None:
+        yield pending.result()
+    yield encoder.close()
+    audio_encoder.record(fmt, encoder.wav_bytes, encoder.output_bytes)
+    print(f"Streamed {n_chunks} chunks in {time.time() - t_start} seconds.")
+
+
+@app.post("/tts/stream")
+async def tts_stream_endpoint(
+    text: str = Form(...),
+    voice_id: str = Form(DEFAULT_SPK_ID),
+    format: Optional[str] = Form(None),
+    accept: Optional[str] = Header(None)
+):
+    """
+    Chunked audio response (wav or ogg/opus): playback can start after the
+    first chunk. Cached phrases are returned whole.
+    """
+    _require_ready()
+    _check_voice(voice_id)
+    fmt = _negotiate(format, accept, streaming=True)
+    loop = asyncio.get_running_loop()
+    audio_bytes = await loop.run_in_executor(audio_encoder.executor, audio_cache.get, cache_key(text, voice_id, fmt))
+    if audio_bytes is not None:
+        return Response(audio_bytes, media_type=media_type(fmt), headers={"X-Cache": "hit"})
+    return StreamingResponse(_stream_chunks(text, voice_id, fmt), media_type=media_type(fmt))
+
+
+@app.post("/voices", status_code=201)
+async def register_voice(
+    voice_id: str = Form(...),
+    prompt_text: str = Form(...),
+    file: UploadFile = File(...)
+):
+    """
+    Upload a reference clip and its transcript; prompt features are computed
+    once and persisted, then `voice_id` can be passed to /tts.
+    """
+    _require_ready()
+    audio_bytes = await file.read()
+    loop = asyncio.get_running_loop()
+    try:
+        return await loop.run_in_executor(tts_executor, voices.register, voice_id, audio_bytes, prompt_text)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@app.get("/voices")
+async def list_voices():
+    _require_ready()
+    return {"voices": voices.list(), **voices.stats()}
+
 
-    return FileResponse(output_path, media_type="audio/wav", filename="tts.wav")
\ No newline at end of file
+@app.delete("/voices/{voice_id}")
+async def delete_voice(voice_id: str):
+    _require_ready()
+    try:
+        voices.delete(voice_id)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Unknown voice_id '{voice_id}'")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"deleted": voice_id}
@@ -0,0 +1,193 @@
+# tts_service/audio_cache.py
+
+"""
+Content-addressed cache for synthesized, encoded audio.
+
+Keys are a SHA-256 over the normalized text, the voice (prompt feature)
+fingerprint, the model path and any output settings, so the persona's stock
+lines are synthesized once and then served as bytes. Two tiers: a bounded
+in-memory LRU, and an optional on-disk directory capped by total size, where
+the least recently used files are evicted first. Disk hits are promoted back
+into memory.
+"""
+
+import hashlib
+import json
+import os
+import re
+import threading
+import unicodedata
+from collections import OrderedDict
+
+MEMORY_MAX_MB = float(os.environ.get("TTS_CACHE_MEMORY_MB", 64))
+# 为空则只做内存缓存
+DISK_DIR = os.environ.get("TTS_CACHE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "audio_cache"))
+DISK_MAX_MB = float(os.environ.get("TTS_CACHE_DISK_MB", 1024))
+
+_SPACES = re.compile(r"\s+")
+
+
+def normalize(text: str) -> str:
+    """
+    Only differences that cannot change the audio are removed (Unicode form,
+    whitespace); case and punctuation affect prosody and are kept.
+    """
+    return _SPACES.sub(" ", unicodedata.normalize("NFKC", text)).strip()
+
+
+class AudioCache:
+    def __init__(self, memory_max_mb=MEMORY_MAX_MB, disk_dir=DISK_DIR, disk_max_mb=DISK_MAX_MB, suffix=".bin"):
+        self.memory_max_bytes = int(memory_max_mb * 1024 * 1024)
+        self.disk_dir = disk_dir or None
+        self.disk_max_bytes = int(disk_max_mb * 1024 * 1024)
+        self.suffix = suffix
+
+        self._memory = OrderedDict()  # key -> bytes
+        self._memory_bytes = 0
+        self._disk = OrderedDict()  # key -> size，按最近使用排序
+        self._disk_bytes = 0
+        self._lock = threading.Lock()
+
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.memory_evictions = 0
+        self.disk_evictions = 0
+
+        if self.disk_dir:
+            os.makedirs(self.disk_dir, exist_ok=True)
+            self._scan_disk()
+
+    @staticmethod
+    def make_key(text: str, voice: str, model_path: str, settings: dict = None) -> str:
+        h = hashlib.sha256()
+        h.update(normalize(text).encode("utf-8"))
+        h.update(b"\0" + voice.encode())
+        h.update(b"\0" + model_path.encode())
+        h.update(b"\0" + json.dumps(settings or {}, sort_keys=True).encode())
+        return h.hexdigest()
+
+    def get(self, key):
+        with self._lock:
+            data = self._memory.get(key)
+            if data is not None:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                return data
+            on_disk = key in self._disk
+
+        if on_disk:
+            path = self._path(key)
+            try:
+                with open(path, "rb") as f:
+                    data = f.read()
+                os.utime(path)
+            except OSError:
+                data = None
+            with self._lock:
+                if data is None:
+                    self._forget_disk(key)
+                else:
+                    self._disk.move_to_end(key)
+                    self.disk_hits += 1
+                    self._put_memory(key, data)
+                    return data
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key, data: bytes):
+        with self._lock:
+            self._put_memory(key, data)
+        if not self.disk_dir:
+            return
+
+        path = self._path(key)
+        tmp_path = f"{path}.tmp"
+        try:
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"Failed to write audio cache entry {path}: {e}")
+            return
+
+        with self._lock:
+            self._forget_disk(key)
+            self._disk[key] = len(data)
+            self._disk_bytes += len(data)
+            evicted = []
+            while self._disk_bytes > self.disk_max_bytes and len(self._disk) > 1:
+                old_key, _ = next(iter(self._disk.items()))
+                self._forget_disk(old_key)
+                evicted.append(old_key)
+            self.disk_evictions += len(evicted)
+
+        for old_key in evicted:
+            try:
+                os.remove(self._path(old_key))
+            except OSError:
+                pass
+
+    def stats(self):
+        with self._lock:
+            hits = self.memory_hits + self.disk_hits
+            lookups = hits + self.misses
+            return {
+                "memory_entries": len(self._memory),
+                "memory_mb": round(self._memory_bytes / 1024 / 1024, 2),
+                "memory_max_mb": round(self.memory_max_bytes / 1024 / 1024, 2),
+                "disk_entries": len(self._disk),
+                "disk_mb": round(self._disk_bytes / 1024 / 1024, 2),
+                "disk_max_mb": round(self.disk_max_bytes / 1024 / 1024, 2),
+                "disk_dir": self.disk_dir,
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+                "memory_evictions": self.memory_evictions,
+                "disk_evictions": self.disk_evictions,
+            }
+
+    # ---------------- internals (caller holds the lock) ----------------
+
+    def _put_memory(self, key, data):
+        if len(data) > self.memory_max_bytes:
+            return
+        old = self._memory.pop(key, None)
+        if old is not None:
+            self._memory_bytes -= len(old)
+        self._memory[key] = data
+        self._memory_bytes += len(data)
+        while self._memory_bytes > self.memory_max_bytes:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_bytes -= len(evicted)
+            self.memory_evictions += 1
+
+    def _forget_disk(self, key):
+        size = self._disk.pop(key, None)
+        if size is not None:
+            self._disk_bytes -= size
+
+    def _path(self, key):
+        return os.path.join(self.disk_dir, key + self.suffix)
+
+    def _scan_disk(self):
+        """
+        Rebuild the disk index from the directory, oldest access first.
+        """
+        entries = []
+        for name in os.listdir(self.disk_dir):
+            if not name.endswith(self.suffix):
+                continue
+            try:
+                st = os.stat(os.path.join(self.disk_dir, name))
+            except OSError:
+                continue
+            entries.append((st.st_mtime, name[:-len(self.suffix)], st.st_size))
+        for _, key, size in sorted(entries):
+            self._disk[key] = size
+            self._disk_bytes += size
+        if entries:
+            print(f"Audio cache: {len(entries)} entries ({self._disk_bytes / 1024 / 1024:.1f} MB) in {self.disk_dir}")
@@ -0,0 +1,199 @@
+# tts_service/audio_encode.py
+
+"""
+Compressed output formats for synthesized audio.
+
+Supported: WAV (16-bit PCM), FLAC, MP3 and Opus in Ogg, all through
+libsndfile (soundfile). The format is picked by an explicit `format`
+parameter, falling back to the Accept header, then WAV.
+
+Encoding runs on its own thread pool, so a request's encode overlaps with
+synthesis of the next chunk or request. Only WAV and Ogg/Opus can be written
+incrementally (libsndfile rewrites the MP3 and FLAC headers on close), so
+only those are offered for streaming.
+"""
+
+import io
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import soundfile as sf
+import torch
+import torchaudio
+
+from wav_utils import encode_wav, wav_header, to_pcm16
+
+ENCODE_WORKERS = int(os.environ.get("TTS_ENCODE_WORKERS", 2))
+
+# name -> (media type, libsndfile format, subtype)
+FORMATS = {
+    "wav": ("audio/wav", "WAV", "PCM_16"),
+    "flac": ("audio/flac", "FLAC", "PCM_16"),
+    "mp3": ("audio/mpeg", "MP3", "MPEG_LAYER_III"),
+    "ogg": ("audio/ogg", "OGG", "OPUS"),
+}
+STREAMABLE = {"wav", "ogg"}
+DEFAULT_FORMAT = "wav"
+
+_ALIASES = {
+    "wave": "wav", "opus": "ogg",
+    "audio/wav": "wav", "audio/wave": "wav", "audio/x-wav": "wav",
+    "audio/flac": "flac", "audio/x-flac": "flac",
+    "audio/mpeg": "mp3", "audio/mp3": "mp3",
+    "audio/ogg": "ogg", "audio/opus": "ogg",
+}
+# Opus 只支持这些采样率
+_OPUS_RATES = (8000, 12000, 16000, 24000, 48000)
+
+
+def resolve_format(name):
+    name = name.strip().lower()
+    name = _ALIASES.get(name, name)
+    if name not in FORMATS:
+        raise ValueError(f"Unsupported audio format '{name}', choose one of {sorted(FORMATS)}")
+    return name
+
+
+def negotiate(format_param=None, accept=None):
+    """
+    Explicit format parameter wins; otherwise the highest-q audio type in the
+    Accept header that we can produce; otherwise WAV.
+    """
+    if format_param:
+        return resolve_format(format_param)
+
+    candidates = []
+    for i, item in enumerate((accept or "").split(",")):
+        parts = [p.strip() for p in item.split(";")]
+        media = parts[0].lower()
+        q = 1.0
+        for param in parts[1:]:
+            if param.startswith("q="):
+                try:
+                    q = float(param[2:])
+                except ValueError:
+                    q = 0.0
+        if media in _ALIASES and q > 0:
+            candidates.append((-q, i, _ALIASES[media]))
+    return min(candidates)[2] if candidates else DEFAULT_FORMAT
+
+
+def media_type(fmt):
+    return FORMATS[fmt][0]
+
+
+def _prepare(audio, sample_rate, fmt):
+    """
+    Tensor/ndarray (1, T) or (T,) -> float32 ndarray (T,), resampled if the
+    codec cannot take `sample_rate`.
+    """
+    if isinstance(audio, np.ndarray):
+        audio = torch.from_numpy(audio)
+    audio = audio.detach().cpu().float().reshape(1, -1)
+    if fmt == "ogg" and sample_rate not in _OPUS_RATES:
+        target = min((r for r in _OPUS_RATES if r >= sample_rate), default=48000)
+        audio = torchaudio.functional.resample(audio, sample_rate, target)
+        sample_rate = target
+    return audio[0].clamp(-1.0, 1.0).numpy(), sample_rate
+
+
+class StreamEncoder:
+    """
+    Incremental encoder for one response: `feed` returns the bytes that are
+    ready so far, `close` the rest. Calls must not overlap.
+    """
+
+    def __init__(self, sample_rate, fmt):
+        if fmt not in STREAMABLE:
+            raise ValueError(f"Format '{fmt}' cannot be streamed, choose one of {sorted(STREAMABLE)}")
+        self.sample_rate = sample_rate
+        self.fmt = fmt
+        self.input_samples = 0
+        self.output_bytes = 0
+        self._buffer = io.BytesIO()
+        self._sent = 0
+        self._file = None
+
+    def feed(self, audio):
+        if self.fmt == "wav":
+            pcm = to_pcm16(audio)
+            data = pcm if self.output_bytes else wav_header(self.sample_rate) + pcm
+            self.input_samples += len(pcm) // 2
+            self.output_bytes += len(data)
+            return data
+
+        self.input_samples += audio.shape[-1]
+        samples, rate = _prepare(audio, self.sample_rate, self.fmt)
+        if self._file is None:
+            _, container, subtype = FORMATS[self.fmt]
+            self._file = sf.SoundFile(self._buffer, "w", samplerate=rate, channels=1,
+                                      format=container, subtype=subtype)
+        self._file.write(samples)
+        return self._take()
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+            return self._take()
+        return b""
+
+    @property
+    def wav_bytes(self):
+        return 44 + 2 * self.input_samples
+
+    def _take(self):
+        data = self._buffer.getvalue()[self._sent:]
+        self._sent += len(data)
+        self.output_bytes += len(data)
+        return data
+
+
+class AudioEncoder:
+    def __init__(self, workers=ENCODE_WORKERS):
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="tts-encode")
+        self._lock = threading.Lock()
+        self._stats = {fmt: {"responses": 0, "wav_bytes": 0, "encoded_bytes": 0} for fmt in FORMATS}
+
+    def encode(self, audio, sample_rate, fmt):
+        """
+        Whole-clip encode; returns (bytes, bytes saved compared to 16-bit WAV).
+        """
+        if fmt == "wav":
+            data = encode_wav(audio, sample_rate)
+        else:
+            samples, rate = _prepare(audio, sample_rate, fmt)
+            _, container, subtype = FORMATS[fmt]
+            buffer = io.BytesIO()
+            sf.write(buffer, samples, rate, format=container, subtype=subtype)
+            data = buffer.getvalue()
+        n_samples = audio.shape[-1]
+        wav_bytes = 44 + 2 * n_samples
+        self.record(fmt, wav_bytes, len(data))
+        return data, wav_bytes - len(data)
+
+    def submit(self, fn, *args):
+        return self.executor.submit(fn, *args)
+
+    def stream(self, sample_rate, fmt):
+        return StreamEncoder(sample_rate, fmt)
+
+    def record(self, fmt, wav_bytes, encoded_bytes):
+        with self._lock:
+            s = self._stats[fmt]
+            s["responses"] += 1
+            s["wav_bytes"] += wav_bytes
+            s["encoded_bytes"] += encoded_bytes
+
+    def stats(self):
+        with self._lock:
+            result = {}
+            for fmt, s in self._stats.items():
+                result[fmt] = {
+                    **s,
+                    "bytes_saved": s["wav_bytes"] - s["encoded_bytes"],
+                    "compression_ratio": round(s["wav_bytes"] / s["encoded_bytes"], 2) if s["encoded_bytes"] else 0.0,
+                }
+            return result
@@ -2,7 +2,6 @@ import sys
 import os
 import time
 import torch
-import re
 current_dir = os.path.dirname(os.path.abspath(__file__))
 cosyvoice_root = os.path.join(current_dir, "CosyVoice")
 
@@ -14,6 +13,7 @@ sys.path.insert(0, os.path.join(cosyvoice_root, "third_party", "AcademiCodec"))
 
 from CosyVoice.cosyvoice.cli.cosyvoice import CosyVoice2
 from CosyVoice.cosyvoice.utils.file_utils import load_wav
+from text_split import split_sentences
 import torchaudio
 t_all_start = time.perf_counter()
 
@@ -39,18 +39,7 @@ prompt_text = (
     "Hahahaha!Hahahaha!Hahahaha! spongebob, can we lower the volume please?"
 )
 
-def split_en(text):
-    parts = re.split(r'([。！？])', text)
-    res = []
-    for i in range(0, len(parts), 2):
-        seg = parts[i].strip()
-        if not seg:
-            continue
-        punct = parts[i + 1] if i + 1 < len(parts) else ""
-        res.append(seg + punct)
-    return res or [text]
-
-sentences = split_en(text)
+sentences = split_sentences(text) or [text]
 
 all_chunks = []
 t_infer_start = time.perf_counter()
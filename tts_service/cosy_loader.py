@@ -1,7 +1,13 @@
 # tts_service/cosy_loader.py
 
+import hashlib
 import os
 import sys
+import time
+import uuid
+from contextlib import contextmanager
+
+import torch
 
 # 路径设置
 current_dir = os.path.dirname(os.path.abspath(__file__))
@@ -20,13 +26,105 @@ fixed_prompt_audio_path = os.path.join(
     cosyvoice_root, "example_audio", "squidward_16k_clean.wav"
 )
 
+# 默认固定 prompt_text，你也可以换成任何中文或英文
+DEFAULT_PROMPT_TEXT = (
+    "look spongebob i told you use your net and go fish! "
+    "happy birthday, SpongeBob SquarePants! are you insane. "
+    "Hahahaha,Hahahaha,Hahahaha! I'll ever get surrounded by such loser neighbors! "
+    "Hahahaha!Hahahaha!Hahahaha! spongebob, can we lower the volume please?"
+)
+
+# 预计算的 zero-shot prompt 特征在 frontend.spk2info 中的 key
+DEFAULT_SPK_ID = "default"
+# prompt 特征缓存目录；设为空字符串则不落盘
+PROMPT_CACHE_DIR = os.environ.get("TTS_PROMPT_CACHE_DIR", os.path.join(current_dir, "prompt_cache"))
+
 from CosyVoice.cosyvoice.cli.cosyvoice import CosyVoice2
 from CosyVoice.cosyvoice.utils.file_utils import load_wav
 
-print("Loading CosyVoice2 model...")
-cosyvoice = CosyVoice2(model_path, load_jit=False, load_trt=False, fp16=False)
-print("CosyVoice2 loaded!")
 
-print("Loading fixed prompt audio...")
-prompt_speech_16k = load_wav(fixed_prompt_audio_path, 16000)
-print("Prompt audio loaded!")
+def prompt_cache_key(prompt_audio_path, prompt_text, sample_rate):
+    """
+    Hash of the prompt audio bytes, the prompt text and the output sample rate
+    (the prompt mel features depend on it).
+    """
+    h = hashlib.sha256()
+    with open(prompt_audio_path, "rb") as f:
+        h.update(f.read())
+    h.update(prompt_text.encode("utf-8"))
+    h.update(str(sample_rate).encode())
+    return h.hexdigest()
+
+
+def register_prompt(cosyvoice, spk_id, prompt_text, prompt_speech_16k, prompt_audio_path, cache_dir=PROMPT_CACHE_DIR):
+    """
+    Compute the zero-shot prompt features (prompt text tokens, speech tokens,
+    speaker embedding, prompt mel) once and store them in frontend.spk2info
+    under `spk_id`, so inference_zero_shot(..., zero_shot_spk_id=spk_id)
+    skips the prompt frontend on every request.
+
+    With `cache_dir` set, the features are persisted to / loaded from
+    <cache_dir>/<hash>.pt keyed by prompt audio + text.
+    """
+    cache_path = None
+    if cache_dir:
+        key = prompt_cache_key(prompt_audio_path, prompt_text, cosyvoice.sample_rate)
+        cache_path = os.path.join(cache_dir, f"{key}.pt")
+        if os.path.exists(cache_path):
+            try:
+                features = torch.load(cache_path, map_location=cosyvoice.frontend.device)
+                cosyvoice.frontend.spk2info[spk_id] = features
+                print(f"Prompt features loaded from {cache_path}")
+                return
+            except Exception as e:
+                print(f"Failed to load prompt features from {cache_path}: {e}")
+
+    t_start = time.perf_counter()
+    cosyvoice.add_zero_shot_spk(prompt_text, prompt_speech_16k, spk_id)
+    print(f"Prompt features computed in {time.perf_counter() - t_start:.3f} s")
+
+    if cache_path:
+        os.makedirs(cache_dir, exist_ok=True)
+        tmp_path = cache_path + ".tmp"
+        torch.save(cosyvoice.frontend.spk2info[spk_id], tmp_path)
+        os.replace(tmp_path, cache_path)
+        print(f"Prompt features saved to {cache_path}")
+
+
+@contextmanager
+def call_spk_id(cosyvoice, spk_id):
+    """
+    Per-call zero_shot_spk_id holding a shallow copy of spk2info[spk_id].
+
+    frontend_zero_shot writes the text tokens into spk2info[zero_shot_spk_id]
+    and returns that same dict as the model input, so concurrent calls sharing
+    one spk id overwrite each other's text. The copy shares the (read-only)
+    prompt tensors and is dropped when the block exits.
+    """
+    spk2info = cosyvoice.frontend.spk2info
+    call_id = f"__call_{uuid.uuid4().hex}"
+    spk2info[call_id] = dict(spk2info[spk_id])
+    try:
+        yield call_id
+    finally:
+        spk2info.pop(call_id, None)
+
+
+def load_cosyvoice():
+    print("Loading CosyVoice2 model...")
+    cosyvoice = CosyVoice2(model_path, load_jit=False, load_trt=False, fp16=False)
+    print("CosyVoice2 loaded!")
+    return cosyvoice
+
+
+def load_default_voice(cosyvoice):
+    """
+    Register the fixed prompt voice under DEFAULT_SPK_ID; returns its
+    fingerprint (prompt audio + text), used by the synthesized-audio cache.
+    """
+    print("Loading fixed prompt audio...")
+    prompt_speech_16k = load_wav(fixed_prompt_audio_path, 16000)
+    print("Prompt audio loaded!")
+
+    register_prompt(cosyvoice, DEFAULT_SPK_ID, DEFAULT_PROMPT_TEXT, prompt_speech_16k, fixed_prompt_audio_path)
+    return prompt_cache_key(fixed_prompt_audio_path, DEFAULT_PROMPT_TEXT, cosyvoice.sample_rate)
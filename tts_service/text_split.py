@@ -0,0 +1,117 @@
+# tts_service/text_split.py
+
+"""
+Multilingual sentence segmentation for TTS.
+
+Splits a complete reply into sentences that can be synthesized
+independently. Handles Latin (. ! ? …), CJK (。！？), Devanagari (। ॥) and
+Arabic/Urdu (؟ ۔) sentence punctuation. A Latin full stop only ends a
+sentence before whitespace, and not after an abbreviation or an initial
+("Dr. Smith", "e.g. this", "3.5"); the abbreviation rules are shared with the
+LLM service's incremental splitter (llm_service/sentences.py). Fragments
+shorter than `min_chars` (CJK characters count triple) are merged into a
+neighbour, and overly long sentences are split further at clause
+punctuation, so every piece is a sensible synthesis unit.
+"""
+
+import os
+import re
+import sys
+
+# 复用 llm_service 中的缩写规则，两个分句器保持一致；追加到末尾，避免同名模块遮蔽本目录
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "llm_service"))
+from sentences import is_abbreviation
+
+MIN_CHARS = int(os.environ.get("TTS_SPLIT_MIN_CHARS", 10))
+MAX_CHARS = int(os.environ.get("TTS_SPLIT_MAX_CHARS", 200))
+
+_CLOSERS = "\"'”’)]」』）"
+# 拉丁标点后必须跟空白（或文本结束）才算句末，避免 "3.5"、"a.m." 中间被切开
+_LATIN_END = re.compile(r"[.!?…]+[" + re.escape(_CLOSERS) + r"]*(?=\s|$)")
+# 中日文、天城文、阿拉伯文句末标点无需空白
+_WIDE_END = re.compile(r"[。！？!?।॥؟۔]+[" + re.escape(_CLOSERS) + r"]*")
+_CLAUSE = re.compile(r"[,;:，；：、،]+\s*")
+
+
+def _boundaries(text):
+    ends = set()
+    for m in _LATIN_END.finditer(text):
+        if m.group(0).rstrip(_CLOSERS) == "." and is_abbreviation(text[:m.start()], text[m.end():]):
+            continue
+        ends.add(m.end())
+    for m in _WIDE_END.finditer(text):
+        ends.add(m.end())
+    return sorted(ends)
+
+
+def _split_long(sentence, max_chars):
+    """
+    Split a sentence longer than max_chars at clause punctuation, then at
+    whitespace as a last resort.
+    """
+    if len(sentence) <= max_chars:
+        return [sentence]
+    pieces, current = [], ""
+    for part in re.split(r"(?<=[,;:，；：、،])", sentence):
+        if current and len(current) + len(part) > max_chars:
+            pieces.append(current.strip())
+            current = ""
+        current += part
+    if current.strip():
+        pieces.append(current.strip())
+
+    result = []
+    for piece in pieces:
+        while len(piece) > max_chars:
+            cut = piece.rfind(" ", 0, max_chars)
+            cut = cut if cut > 0 else max_chars
+            result.append(piece[:cut].strip())
+            piece = piece[cut:].strip()
+        if piece:
+            result.append(piece)
+    return result
+
+
+def split_sentences(text: str, min_chars=MIN_CHARS, max_chars=MAX_CHARS):
+    """
+    Split text into TTS-sized sentences, in order. Never returns an empty list
+    for non-blank input.
+    """
+    text = text.strip()
+    if not text:
+        return []
+
+    sentences, start = [], 0
+    for end in _boundaries(text) + [len(text)]:
+        sentence = text[start:end].strip()
+        if sentence:
+            sentences.extend(_split_long(sentence, max_chars))
+        start = end
+
+    # 过短的片段（如 "Oh." "嗯。"）并入前一句，单独合成效果差
+    merged = []
+    for sentence in sentences:
+        if merged and (_units(sentence) < min_chars or _units(merged[-1]) < min_chars) \
+                and len(merged[-1]) + len(sentence) + 1 <= max_chars:
+            merged[-1] = _join(merged[-1], sentence)
+        else:
+            merged.append(sentence)
+    return merged
+
+
+def _is_wide(ch):
+    return ord(ch) > 0x2E7F
+
+
+def _units(sentence):
+    """
+    Rough spoken length: a CJK character counts like three Latin characters.
+    """
+    return sum(3 if _is_wide(ch) else 1 for ch in sentence)
+
+
+def _join(a, b):
+    # CJK 之间不加空格
+    if a and b and _is_wide(a[-1]) and _is_wide(b[0]):
+        return a + b
+    return a + " " + b
@@ -0,0 +1,243 @@
+# tts_service/voice_registry.py
+
+"""
+Registry of zero-shot voices served by one CosyVoice2 model.
+
+A voice is a reference clip plus its transcript. On registration the prompt
+features (text tokens, speech tokens, speaker embedding, prompt mel) are
+computed once and written to <storage_dir>/<voice_id>/ together with the clip
+and metadata. At most `max_loaded` voices are kept in `frontend.spk2info`;
+the least recently used ones are dropped from memory and reloaded from disk
+on demand, so requests never run prompt feature extraction.
+"""
+
+import hashlib
+import io
+import json
+import os
+import re
+import shutil
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import torch
+import torchaudio
+
+STORAGE_DIR = os.environ.get("TTS_VOICE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "voices"))
+MAX_LOADED = int(os.environ.get("TTS_VOICE_CACHE_SIZE", 8))
+# CosyVoice 建议 prompt 音频不超过 30 秒
+MAX_PROMPT_SEC = float(os.environ.get("TTS_VOICE_MAX_PROMPT_SEC", 30))
+PROMPT_SAMPLE_RATE = 16000
+
+_VOICE_ID = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+
+def voice_fingerprint(audio_bytes, prompt_text, sample_rate):
+    h = hashlib.sha256()
+    h.update(audio_bytes)
+    h.update(prompt_text.encode("utf-8"))
+    h.update(str(sample_rate).encode())
+    return h.hexdigest()
+
+
+class VoiceRegistry:
+    def __init__(self, cosyvoice, storage_dir=STORAGE_DIR, max_loaded=MAX_LOADED):
+        self.cosyvoice = cosyvoice
+        self.storage_dir = storage_dir
+        self.max_loaded = max_loaded
+
+        self._meta = {}  # voice_id -> metadata
+        self._loaded = OrderedDict()  # voice_id -> None，按最近使用排序
+        self._pinned = set()
+        self._in_use = {}  # voice_id -> 正在合成的请求数
+        self._lock = threading.Lock()
+
+        self.loads = 0
+        self.evictions = 0
+
+        os.makedirs(self.storage_dir, exist_ok=True)
+        self._scan()
+
+    @staticmethod
+    def validate_id(voice_id):
+        if not isinstance(voice_id, str) or not _VOICE_ID.match(voice_id):
+            raise ValueError("voice_id must be 1-64 characters of [A-Za-z0-9_-]")
+        return voice_id
+
+    def add_builtin(self, voice_id, prompt_text, fingerprint):
+        """
+        Register a voice whose features are already in spk2info (loaded by
+        cosy_loader). Built-in voices are pinned and cannot be deleted.
+        """
+        with self._lock:
+            self._meta[voice_id] = {
+                "voice_id": voice_id,
+                "prompt_text": prompt_text,
+                "fingerprint": fingerprint,
+                "builtin": True,
+            }
+            self._pinned.add(voice_id)
+            self._loaded[voice_id] = None
+
+    def register(self, voice_id, audio_bytes, prompt_text):
+        """
+        Compute and persist the prompt features for an uploaded clip.
+        Re-registering an existing id replaces it.
+        """
+        self.validate_id(voice_id)
+        prompt_text = prompt_text.strip()
+        if not prompt_text:
+            raise ValueError("prompt_text must not be empty")
+        if voice_id in self._pinned:
+            raise ValueError(f"voice '{voice_id}' is built in and cannot be replaced")
+
+        try:
+            speech, sr = torchaudio.load(io.BytesIO(audio_bytes))
+        except Exception as e:
+            raise ValueError(f"could not decode reference audio: {e}")
+        speech = speech.mean(dim=0, keepdim=True)
+        if sr != PROMPT_SAMPLE_RATE:
+            speech = torchaudio.transforms.Resample(orig_freq=sr, new_freq=PROMPT_SAMPLE_RATE)(speech)
+        duration = speech.shape[1] / PROMPT_SAMPLE_RATE
+        if duration < 1.0 or duration > MAX_PROMPT_SEC:
+            raise ValueError(f"reference audio must be between 1 and {MAX_PROMPT_SEC:g} seconds, got {duration:.1f}")
+
+        t_start = time.perf_counter()
+        # 先在临时 key 下计算，避免覆盖正在使用的同名音色
+        tmp_id = f"__register_{voice_id}_{threading.get_ident()}"
+        self.cosyvoice.add_zero_shot_spk(prompt_text, speech, tmp_id)
+        features = self.cosyvoice.frontend.spk2info.pop(tmp_id)
+        extract_sec = time.perf_counter() - t_start
+
+        meta = {
+            "voice_id": voice_id,
+            "prompt_text": prompt_text,
+            "fingerprint": voice_fingerprint(audio_bytes, prompt_text, self.cosyvoice.sample_rate),
+            "duration_sec": round(duration, 2),
+            "created_at": time.time(),
+            "builtin": False,
+        }
+
+        voice_dir = os.path.join(self.storage_dir, voice_id)
+        tmp_dir = f"{voice_dir}.tmp{threading.get_ident()}"
+        os.makedirs(tmp_dir, exist_ok=True)
+        torch.save(features, os.path.join(tmp_dir, "features.pt"))
+        torchaudio.save(os.path.join(tmp_dir, "prompt.wav"), speech, PROMPT_SAMPLE_RATE)
+        with open(os.path.join(tmp_dir, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False, indent=2)
+
+        with self._lock:
+            if os.path.exists(voice_dir):
+                shutil.rmtree(voice_dir)
+            os.replace(tmp_dir, voice_dir)
+            self._meta[voice_id] = meta
+            self.cosyvoice.frontend.spk2info[voice_id] = features
+            self._loaded[voice_id] = None
+            self._loaded.move_to_end(voice_id)
+            self._evict()
+
+        print(f"Registered voice '{voice_id}' ({duration:.1f} s prompt, features in {extract_sec:.2f} s)")
+        return meta
+
+    def delete(self, voice_id):
+        with self._lock:
+            if voice_id not in self._meta:
+                raise KeyError(voice_id)
+            if voice_id in self._pinned:
+                raise ValueError(f"voice '{voice_id}' is built in and cannot be deleted")
+            del self._meta[voice_id]
+            if voice_id in self._loaded and not self._in_use.get(voice_id):
+                del self._loaded[voice_id]
+                self.cosyvoice.frontend.spk2info.pop(voice_id, None)
+            shutil.rmtree(os.path.join(self.storage_dir, voice_id), ignore_errors=True)
+
+    def get(self, voice_id):
+        with self._lock:
+            if voice_id not in self._meta:
+                raise KeyError(voice_id)
+            return dict(self._meta[voice_id])
+
+    def list(self):
+        with self._lock:
+            return [{**m, "loaded": m["voice_id"] in self._loaded} for m in self._meta.values()]
+
+    @contextmanager
+    def use(self, voice_id):
+        """
+        Make sure the voice's features are in spk2info and keep them there
+        (not evictable) until the block exits. Yields the zero_shot_spk_id.
+        """
+        with self._lock:
+            if voice_id not in self._meta:
+                raise KeyError(voice_id)
+            self._in_use[voice_id] = self._in_use.get(voice_id, 0) + 1
+            loaded = voice_id in self._loaded
+            if loaded:
+                self._loaded.move_to_end(voice_id)
+
+        try:
+            if not loaded:
+                features = torch.load(
+                    os.path.join(self.storage_dir, voice_id, "features.pt"),
+                    map_location=self.cosyvoice.frontend.device,
+                )
+                with self._lock:
+                    self.cosyvoice.frontend.spk2info[voice_id] = features
+                    self._loaded[voice_id] = None
+                    self.loads += 1
+                    self._evict()
+            yield voice_id
+        finally:
+            with self._lock:
+                self._in_use[voice_id] -= 1
+                if not self._in_use[voice_id]:
+                    del self._in_use[voice_id]
+                self._evict()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "voices": len(self._meta),
+                "loaded": len(self._loaded),
+                "max_loaded": self.max_loaded,
+                "in_use": sum(self._in_use.values()),
+                "loads": self.loads,
+                "evictions": self.evictions,
+                "storage_dir": self.storage_dir,
+            }
+
+    # ---------------- internals ----------------
+
+    def _evict(self):
+        """
+        Drop least recently used voices from spk2info (caller holds the lock).
+        Pinned and in-use voices stay; deleted voices go as soon as they are idle.
+        """
+        for voice_id in list(self._loaded):
+            if voice_id not in self._meta and not self._in_use.get(voice_id):
+                del self._loaded[voice_id]
+                self.cosyvoice.frontend.spk2info.pop(voice_id, None)
+
+        for voice_id in list(self._loaded):
+            if len(self._loaded) <= self.max_loaded:
+                break
+            if voice_id in self._pinned or self._in_use.get(voice_id):
+                continue
+            del self._loaded[voice_id]
+            self.cosyvoice.frontend.spk2info.pop(voice_id, None)
+            self.evictions += 1
+
+    def _scan(self):
+        for name in sorted(os.listdir(self.storage_dir)):
+            meta_path = os.path.join(self.storage_dir, name, "meta.json")
+            if not _VOICE_ID.match(name) or not os.path.exists(meta_path):
+                continue
+            try:
+                with open(meta_path, encoding="utf-8") as f:
+                    self._meta[name] = json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"Ignoring unreadable voice {name}: {e}")
+        if self._meta:
+            print(f"Voice registry: {len(self._meta)} voices in {self.storage_dir}")
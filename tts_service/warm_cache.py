@@ -0,0 +1,79 @@
+# tts_service/warm_cache.py
+"""
+Pre-render phrases into the TTS audio cache.
+
+    python warm_cache.py                       # built-in stock lines
+    python warm_cache.py phrases.txt           # one phrase per line
+    python warm_cache.py --voice <voice_id>    # a registered voice
+    python warm_cache.py --format wav          # cache entries are per output format
+
+Uses the same cache settings (TTS_CACHE_DIR etc.) as the service, so the
+disk tier written here is picked up by `app.py` on its next start.
+
+Every phrase is rendered whole and also sentence by sentence: the pipelined
+gateway sends each sentence of a reply as its own /tts request.
+"""
+
+import argparse
+import os
+import time
+
+from app import audio_cache, load_models, readiness, render
+from audio_encode import resolve_format
+from cosy_loader import DEFAULT_SPK_ID
+from text_split import split_sentences
+
+# 与网关请求的格式一致（gateway/app.py 的 DEFAULT_TTS_FORMAT），否则缓存 key 对不上
+DEFAULT_FORMAT = os.environ.get("TTS_WARM_FORMAT", "mp3")
+
+# 角色常用台词 / 常见短回复
+STOCK_PHRASES = [
+    "Oh, great. Another neighbor. What do you want?",
+    "Go away, SpongeBob.",
+    "I'm busy practicing my clarinet.",
+    "Can you lower the volume, please?",
+    "Ugh. Fine.",
+    "Leave me alone.",
+    "What is it now?",
+]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("phrases", nargs="?", help="text file with one phrase per line")
+    parser.add_argument("--voice", default=DEFAULT_SPK_ID)
+    parser.add_argument("--format", default=DEFAULT_FORMAT)
+    args = parser.parse_args()
+
+    fmt = resolve_format(args.format)
+
+    load_models()
+    if readiness["status"] != "ready":
+        raise SystemExit(f"Model loading failed: {readiness['error']}")
+
+    if args.phrases:
+        with open(args.phrases, encoding="utf-8") as f:
+            phrases = [line.strip() for line in f if line.strip()]
+    else:
+        phrases = STOCK_PHRASES
+
+    # 网关按句请求时不合并短句，这里同样只按句切分
+    texts = []
+    for phrase in phrases:
+        for text in [phrase] + split_sentences(phrase, min_chars=0):
+            if text not in texts:
+                texts.append(text)
+
+    t_all = time.perf_counter()
+    for text in texts:
+        t_start = time.perf_counter()
+        audio_bytes, cached = render(text, args.voice, fmt)
+        status = "cached" if cached else f"{time.perf_counter() - t_start:.2f} s"
+        print(f"[{status:>8}] {len(audio_bytes) / 1024:7.1f} KB  {text}")
+
+    print(f"Warmed {len(texts)} entries for {len(phrases)} phrases in {time.perf_counter() - t_all:.1f} s")
+    print(audio_cache.stats())
+
+
+if __name__ == "__main__":
+    main()
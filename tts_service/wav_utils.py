@@ -0,0 +1,79 @@
+# tts_service/wav_utils.py
+
+"""
+WAV / PCM helpers for sending synthesized audio without touching disk.
+"""
+
+import struct
+
+import numpy as np
+import torch
+
+# 流式输出时总长度未知，RIFF/data 长度字段按惯例填 0xFFFFFFFF
+UNKNOWN_SIZE = 0xFFFFFFFF
+
+
+def wav_header(sample_rate, channels=1, bits_per_sample=16, data_size=None):
+    """
+    44-byte PCM WAV header. With `data_size=None` the RIFF and data sizes are
+    set to 0xFFFFFFFF, which players and ffmpeg accept as "until end of stream".
+    """
+    block_align = channels * bits_per_sample // 8
+    byte_rate = sample_rate * block_align
+    if data_size is None:
+        riff_size = data_size = UNKNOWN_SIZE
+    else:
+        riff_size = 36 + data_size
+    return (
+        b"RIFF" + struct.pack("<I", riff_size) + b"WAVE"
+        + b"fmt " + struct.pack("<IHHIIHH", 16, 1, channels, sample_rate, byte_rate, block_align, bits_per_sample)
+        + b"data" + struct.pack("<I", data_size)
+    )
+
+
+def to_pcm16(audio):
+    """
+    Float waveform (torch tensor or ndarray, [-1, 1], shape (T,) or (1, T))
+    -> little-endian int16 bytes.
+    """
+    if hasattr(audio, "detach"):
+        audio = audio.detach().cpu().numpy()
+    audio = np.asarray(audio, dtype=np.float32).reshape(-1)
+    return (np.clip(audio, -1.0, 1.0) * 32767).astype("<i2").tobytes()
+
+
+def encode_wav(audio, sample_rate):
+    """
+    Complete in-memory mono 16-bit WAV file.
+    """
+    pcm = to_pcm16(audio)
+    return wav_header(sample_rate, data_size=len(pcm)) + pcm
+
+
+def stitch(segments, sample_rate, gap_ms=0, crossfade_ms=0):
+    """
+    Join waveform tensors (1, T) in order. Every boundary gets a
+    `crossfade_ms` fade: with a silence gap the tail fades out and the next
+    head fades in around `gap_ms` of silence; with no gap the two overlap
+    and are crossfaded, so there are no clicks at sentence joins.
+    """
+    if not segments:
+        return torch.zeros(1, 0)
+    fade = int(sample_rate * crossfade_ms / 1000)
+    gap = torch.zeros(1, int(sample_rate * gap_ms / 1000), dtype=segments[0].dtype)
+
+    out = segments[0]
+    for seg in segments[1:]:
+        n = min(fade, out.shape[-1], seg.shape[-1])
+        ramp = torch.linspace(0.0, 1.0, n, dtype=seg.dtype) if n else None
+        if gap.shape[-1] > 0:
+            if n:
+                out = torch.cat([out[..., :-n], out[..., -n:] * ramp.flip(0)], dim=-1)
+                seg = torch.cat([seg[..., :n] * ramp, seg[..., n:]], dim=-1)
+            out = torch.cat([out, gap, seg], dim=-1)
+        elif n:
+            overlap = out[..., -n:] * ramp.flip(0) + seg[..., :n] * ramp
+            out = torch.cat([out[..., :-n], overlap, seg[..., n:]], dim=-1)
+        else:
+            out = torch.cat([out, seg], dim=-1)
+    return out